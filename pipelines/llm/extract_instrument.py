@@ -11,7 +11,7 @@ import json
 import os
 
 from src.llm.mq_iterclass import iter_items_from_files_with_helpers
-from src.llm.openai_api import OPENAI_API_DEEPSEEK
+from src.llm.openai_api import OPENAI_API, OPENAI_API_DEEPSEEK
 from src.transcript.normalize_transcript import NormFinder
 from template.template_20260424_2026 import (
     SCHEMA_INSTRUMENT_RULES_EXTRACT as schema,
@@ -26,21 +26,24 @@ load_dotenv()
 TRANSCRIPT_GLOB = 'transcripts/clean/*'
 OCR_JSON_FOLDER = 'ocr/json'
 MODEL = 'deepseek-v4-flash'
+# DeepSeek has no batch API, so offline backfills run on OpenAI
+OFFLINE_MODEL = 'gpt-5-nano'
 OUTPUT_PREFIX = '2026_04_24_t1'
 BATCHES = range(3)
 
 nf = NormFinder('')
 
 
-def build_apps():
+def build_apps(api=OPENAI_API_DEEPSEEK, model=MODEL, temperature=0, use_cache=True):
     apps = {}
     for batch in BATCHES:
-        apps[batch] = OPENAI_API_DEEPSEEK(
+        apps[batch] = api(
             ts,
             '%s_%s' % (OUTPUT_PREFIX, batch),
             schema,
-            model=MODEL,
-            temperature=0,
+            model=model,
+            temperature=temperature,
+            use_cache=use_cache,
         )
     return apps
 
@@ -116,5 +119,30 @@ def run(batch_dates=None):
     return errlist
 
 
+def run_offline(batch_dates=None):
+    """Backfill: every pending day in one provider batch per app, instead of a call per day."""
+    # reasoning models only accept the default temperature; each batch is an
+    # independent sample, so none of them may be served from the response cache
+    apps = build_apps(OPENAI_API, OFFLINE_MODEL, temperature=1.0, use_cache=False)
+
+    if batch_dates is None:
+        batch_dates = list_batch_dates()
+
+    files = []
+    for dt in batch_dates:
+        files.extend(glob.glob(f'transcripts/clean/{dt}.txt'))
+    files = sorted(files)
+    if not files:
+        return {}
+    helpers = [build_helper(os.path.basename(x).split('.')[0]) for x in files]
+
+    ret = {}
+    for batch, app in apps.items():
+        ret[batch] = app.run_batch_offline(
+            iter_items_from_files_with_helpers(files, helpers=helpers),
+        )
+    return ret
+
+
 if __name__ == '__main__':
     run(['20260402'])
@@ -18,8 +18,13 @@ import os
 import re
 import subprocess
 import time
-import io
 import shutil
+import bisect
+import hashlib
+import queue
+import tempfile
+import threading
+from functools import lru_cache
 import cv2
 import numpy as np
 import onnxruntime as ort
@@ -27,19 +32,40 @@ import multiprocessing as mp
 from rapidocr_onnxruntime import RapidOCR
 from ultralytics import YOLO
 from tqdm import tqdm
+from src.worker_pool import WarmPool
 
 STEP_SEC = 30
+# 'fixed' samples every STEP_SEC; 'adaptive' spends a frames-per-hour budget
+# on the seconds right after ffmpeg scene changes, on top of a sparse grid
+SAMPLING = 'fixed'
+ADAPTIVE_FRAMES_PER_HOUR = 180
+ADAPTIVE_MAX_STEP_SEC = 60
+ADAPTIVE_MIN_STEP_SEC = 5
+ADAPTIVE_MIN_SCENE_SCORE = 0.08
+ADAPTIVE_SETTLE_SEC = 2
+SCENE_SCAN_FPS = 1
+SCENE_SCAN_WIDTH = 160
 SLIDE_MATCH_THRESHOLD = 0.80
 RESCALED_SLIDE_MATCH_THRESHOLD = 0.33
 OCR_CHAR_MATCH_RATIO_THRESHOLD = 0.70
 BOX_SCREEN_RATIO_THRESHOLD = (0.5 , 0.62)
 
+# dHash tier in front of matchTemplate: normalized hamming distance at or below
+# SAME_MAX is unchanged, at or above CHANGED_MIN is changed, else matchTemplate decides.
+# VERIFY keeps running matchTemplate so diff_ratio2 can be checked against the hash call.
+CHANGE_HASH_TIER = True
+CHANGE_HASH_SIZE = 16
+CHANGE_HASH_SAME_MAX = 0.05
+CHANGE_HASH_CHANGED_MIN = 0.35
+CHANGE_HASH_VERIFY = False
+
 HOST_OVERLAY_MAX = 0.20
 HOST_IMAGE_RATIO_THRESHOLD = 0.10
 SAVE_DEBUG_FRAME = 0
 DEBUG = 0
 
 OCR_UPSCALE = 2
+OCR_BATCH = 8
 OCR_MODEL_DIR = str(ROOT / 'ocr' / 'models')
 OCR_DET_MODEL_PATH = f'{OCR_MODEL_DIR}/det.onnx'
 OCR_REC_MODEL_PATH = f'{OCR_MODEL_DIR}/rec.onnx'
@@ -49,6 +75,17 @@ YOLO_MODEL_PATH = str(ROOT / 'yolo' / 'weights' / 'current.pt')
 YOLO_CONF = 0.1
 YOLO_IOU = 0.45
 YOLO_DEVICE = 0
+YOLO_BATCH = 8
+PREFETCH_BATCHES = 1
+
+# layouts are cached per video second under a key of (weights hash, conf, iou),
+# so threshold re-tuning replays detections instead of re-running YOLO
+LAYOUT_CACHE = True
+# reuse the last detection while a thumbnail of the frame has barely moved
+LAYOUT_REUSE = False
+LAYOUT_REUSE_MAX_DIFF = 4.0
+LAYOUT_REUSE_MAX_SEC = 300
+LAYOUT_THUMB_SIZE = (64, 36)
 
 WATERMARK_PATTERNS = [
     r'上帝影视',
@@ -56,13 +93,22 @@ WATERMARK_PATTERNS = [
     r'上帝影视\s*god\s*\\?$',
 ]
 N_WORKERS = 3
+# split each video's timeline across N_WORKERS shards when there are fewer
+# pending videos than workers (e.g. the daily run with one new episode)
+SHARD_SMALL_RUNS = True
 SHOW_FRAME_TQDM = False
 VERBOSE = False
+STREAM_FRAMES = True
 MAX_TASKS_PER_CHILD = 1
+# keep workers (and their loaded YOLO/RapidOCR) across videos; recycle a worker
+# only once its RSS after a video exceeds MAX_WORKER_RSS_MB
+WARM_POOL = True
+MAX_WORKER_RSS_MB = 12000
 
 OCR_JSON_DIR = str(ROOT / 'ocr' / 'json')
 OCR_TEXT_DIR = str(ROOT / 'ocr' / 'text')
 OCR_DEBUG_DIR = str(ROOT / 'ocr' / 'debug')
+OCR_LAYOUT_CACHE_DIR = str(ROOT / 'ocr' / 'layout_cache')
 
 providers = ort.get_available_providers()
 USE_CUDA = 'CUDAExecutionProvider' in providers
@@ -108,6 +154,52 @@ def get_yolo():
     return yolo
 
 
+@lru_cache(maxsize=1)
+def get_yolo_weights_hash():
+    h = hashlib.sha1()
+    with open(YOLO_MODEL_PATH, 'rb') as ifile:
+        for chunk in iter(lambda: ifile.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+# raw best screen/host boxes per sampled second; build_layout re-applies the thresholds on replay
+class LayoutCache:
+    def __init__(self, dt, cache_dir=OCR_LAYOUT_CACHE_DIR):
+        key = f'{get_yolo_weights_hash()}_conf{YOLO_CONF}_iou{YOLO_IOU}'
+        self.path = os.path.join(cache_dir, key, f'{dt}.json')
+        self.data = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as ifile:
+                    self.data = json.load(ifile)
+            except Exception:
+                self.data = {}
+
+    def get(self, sec):
+        return self.data.get(str(sec))
+
+    def set(self, sec, detection):
+        self.data[str(sec)] = detection
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as ofile:
+            json.dump(self.data, ofile)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def warm_models():
+    get_yolo()
+    get_ocr()
+
+
 def get_duration(video_path):
     cmd = [
         'ffprobe',
@@ -120,6 +212,21 @@ def get_duration(video_path):
     return float(out)
 
 
+@lru_cache(maxsize=16)
+def get_video_size(video_path):
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height',
+        '-of', 'csv=p=0:s=x',
+        video_path,
+    ]
+    out = subprocess.check_output(cmd).decode().strip()
+    W, H = out.splitlines()[0].split('x')[:2]
+    return int(W), int(H)
+
+
 def sec_to_hhmmss(sec):
     sec = int(sec)
     hh = sec // 3600
@@ -128,7 +235,31 @@ def sec_to_hhmmss(sec):
     return f'{hh:02d}:{mm:02d}:{ss:02d}'
 
 
+_frame_buffer = None
+
+
+def get_frame_buffer(W, H):
+    global _frame_buffer
+    if _frame_buffer is None or _frame_buffer.shape != (H, W, 3):
+        _frame_buffer = np.empty((H, W, 3), dtype=np.uint8)
+    return _frame_buffer
+
+
+def read_raw_frame(stream, buf):
+    view = memoryview(buf).cast('B')
+    got = 0
+    while got < len(view):
+        n = stream.readinto(view[got:])
+        if not n:
+            return False
+        got += n
+    return True
+
+
+# the returned frame is overwritten by the next call
 def extract_frame(video_path, sec):
+    W, H = get_video_size(video_path)
+    buf = get_frame_buffer(W, H)
     cmd = [
         'ffmpeg',
         '-hide_banner',
@@ -137,25 +268,212 @@ def extract_frame(video_path, sec):
         '-ss', str(sec),
         '-i', video_path,
         '-frames:v', '1',
-        '-f', 'image2pipe',
-        '-vcodec', 'png',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'rgb24',
         '-',
     ]
-    ret = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    ok = read_raw_frame(proc.stdout, buf)
+    _, err = proc.communicate()
 
-    if ret.stdout:
-        try:
-            return Image.open(io.BytesIO(ret.stdout)).convert('RGB')
-        except Exception:
-            pass
+    if ok:
+        return buf
 
-    err = ret.stderr.decode(errors='ignore').strip()
+    err = err.decode(errors='ignore').strip()
     raise RuntimeError(err or f'ffmpeg failed for {video_path} @ {sec}s')
 
 
+# [(sec, score)] from one low-res ffmpeg pass with the scene filter
+def get_scene_scores(video_path):
+    cmd = [
+        'ffmpeg',
+        '-hide_banner',
+        '-nostdin',
+        '-loglevel', 'error',
+        '-i', video_path,
+        '-an',
+        '-sn',
+        '-vf', f"fps={SCENE_SCAN_FPS},scale={SCENE_SCAN_WIDTH}:-2,select='gte(scene,0)',metadata=print:file=-",
+        '-f', 'null',
+        '-',
+    ]
+    out = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode(errors='ignore')
+
+    scores = []
+    pts_time = None
+    for line in out.splitlines():
+        m = re.search(r'pts_time:([\d.]+)', line)
+        if m:
+            pts_time = float(m.group(1))
+            continue
+        m = re.search(r'lavfi\.scene_score=([\d.]+)', line)
+        if m and pts_time is not None:
+            scores.append((pts_time, float(m.group(1))))
+            pts_time = None
+    return scores
+
+
+# a grid every ADAPTIVE_MAX_STEP_SEC, the rest of the budget on the strongest scene changes
+def pick_adaptive_secs(scene_scores, duration):
+    last = int(duration)
+    secs = list(range(ADAPTIVE_MAX_STEP_SEC, last + 1, ADAPTIVE_MAX_STEP_SEC))
+    budget = max(len(secs), int(round(ADAPTIVE_FRAMES_PER_HOUR * duration / 3600)))
+
+    candidates = sorted(
+        (x for x in scene_scores if x[1] >= ADAPTIVE_MIN_SCENE_SCORE),
+        key=lambda x: x[1],
+        reverse=True,
+    )
+    for t, _ in candidates:
+        if len(secs) >= budget:
+            break
+        # sample once the transition has settled
+        sec = int(t) + ADAPTIVE_SETTLE_SEC
+        if sec < 1 or sec > last:
+            continue
+        pos = bisect.bisect_left(secs, sec)
+        if pos > 0 and sec - secs[pos - 1] < ADAPTIVE_MIN_STEP_SEC:
+            continue
+        if pos < len(secs) and secs[pos] - sec < ADAPTIVE_MIN_STEP_SEC:
+            continue
+        secs.insert(pos, sec)
+    return secs
+
+
+def pick_sample_secs(video_path, duration):
+    if SAMPLING == 'adaptive':
+        return pick_adaptive_secs(get_scene_scores(video_path), duration)
+    return list(range(STEP_SEC, int(duration) + 1, STEP_SEC))
+
+
+# one ffmpeg decode for all secs; a yielded frame stays valid until n_buffers more are pulled
+def iter_frames(video_path, secs, n_buffers=1):
+    secs = list(secs)
+    if not secs:
+        return
+
+    steps = {b - a for a, b in zip(secs, secs[1:])}
+    if len(steps) <= 1:
+        start = secs[0]
+        step = steps.pop() if steps else 1
+        # round=up puts the first output frame at start rather than at the
+        # nearest 1/step boundary, so frame i is the one at start + i*step
+        select_args = ['-vf', f'fps=1/{step}:round=up']
+    else:
+        # first frame at or after each second, relative to the seek point
+        start = max(0, secs[0] - 1)
+        expr = '+'.join(f'gte(t,{sec - start})*not(gte(prev_t,{sec - start}))' for sec in secs)
+        select_args = ['-vf', f"select='{expr}'", '-vsync', 'passthrough']
+
+    W, H = get_video_size(video_path)
+    buffers = [np.empty((H, W, 3), dtype=np.uint8) for _ in range(max(1, n_buffers))]
+    cmd = [
+        'ffmpeg',
+        '-hide_banner',
+        '-nostdin',
+        '-loglevel', 'error',
+        '-ss', str(start),
+        '-i', video_path,
+        *select_args,
+        '-f', 'rawvideo',
+        '-pix_fmt', 'rgb24',
+        '-',
+    ]
+    # stderr goes to a temp file: a pipe nobody reads while stdout is being
+    # streamed would stall ffmpeg once a long run of warnings fills it
+    errfile = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errfile)
+    idx = 0
+    try:
+        while idx < len(secs):
+            buf = buffers[idx % len(buffers)]
+            if not read_raw_frame(proc.stdout, buf):
+                break
+            yield secs[idx], buf
+            idx += 1
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.communicate()
+        errfile.seek(0)
+        err = errfile.read()
+        errfile.close()
+
+    if idx < len(secs):
+        err = err.decode(errors='ignore').strip()
+        for sec in secs[idx:]:
+            yield sec, RuntimeError(err or f'ffmpeg ended before {video_path} @ {sec}s')
+
+
+def iter_frames_by_seek(video_path, secs):
+    for sec in secs:
+        try:
+            yield sec, extract_frame(video_path, sec).copy()
+        except Exception as e:
+            yield sec, e
+
+
+# decodes up to prefetch batches ahead so ffmpeg is not stalled on a full pipe
+def iter_frame_batches(frame_iter, batch_size, prefetch=PREFETCH_BATCHES):
+    q = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            batch = []
+            for item in frame_iter:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch:
+                put(batch)
+        except Exception as e:
+            put(e)
+        finally:
+            if hasattr(frame_iter, 'close'):
+                frame_iter.close()
+            put(done)
+
+    worker = threading.Thread(target=producer, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+
+def frame_size(frame):
+    return (frame.shape[1], frame.shape[0])
+
+
+def to_gray(frame):
+    if frame.ndim == 2 or frame.size == 0:
+        return frame
+    return cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+
+
 def image_diff_ratio2(img1, img2, center_ratio=0.5):
-    a = np.array(img1.convert('L'))
-    b = np.array(img2.convert('L'))
+    a = to_gray(img1)
+    b = to_gray(img2)
 
     if a.size == 0 or b.size == 0:
         return None
@@ -185,6 +503,15 @@ def image_diff_ratio2(img1, img2, center_ratio=0.5):
     return float(score)
 
 
+def dhash(img, hash_size=CHANGE_HASH_SIZE):
+    small = cv2.resize(to_gray(img), (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return (small[:, 1:] > small[:, :-1]).ravel()
+
+
+def hash_distance(hash1, hash2):
+    return float(np.count_nonzero(hash1 != hash2)) / hash1.size
+
+
 def normalize_box(x0, y0, x1, y1, W, H):
     x0 = max(0, min(int(round(x0)), W))
     y0 = max(0, min(int(round(y0)), H))
@@ -242,19 +569,82 @@ def host_image_ratio(host_box, W, H):
 
 
 def detect_layout(frame):
-    W, H = frame.size
-    full_screen_box = (0, 0, W, H)
-    arr_rgb = np.array(frame)
-    arr_bgr = cv2.cvtColor(arr_rgb, cv2.COLOR_RGB2BGR)
+    return detect_layouts([frame])[0]
+
+
+def detect_layouts(frames):
+    return [build_layout(detection) for detection in run_yolo(frames)]
+
+
+def run_yolo(frames):
+    if not frames:
+        return []
 
-    result = get_yolo().predict(
-        source=arr_bgr,
+    results = get_yolo().predict(
+        source=[cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) for frame in frames],
         conf=YOLO_CONF,
         iou=YOLO_IOU,
         device=YOLO_DEVICE,
         verbose=False,
-    )[0]
+    )
+    return [detection_from_result(result, *frame_size(frame)) for result, frame in zip(results, frames)]
+
+
+def layout_thumb(frame):
+    return cv2.resize(to_gray(frame), LAYOUT_THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+# cached detections are replayed; with reuse, a near-identical frame takes the last detection
+def iter_layouts(frame_iter, batch_size, cache=None, reuse=False):
+    ref = None
+    for batch in iter_frame_batches(frame_iter, batch_size):
+        slots = []
+        pending = []
+        for sec, frame in batch:
+            if isinstance(frame, Exception):
+                slots.append(None)
+                continue
 
+            detection = cache.get(sec) if cache is not None else None
+            if detection is not None and tuple(detection['frame_size']) == frame_size(frame):
+                slot = {'detection': detection, 'source': 'cache'}
+                if reuse:
+                    ref = {'sec': sec, 'thumb': layout_thumb(frame), 'slot': slot}
+                slots.append(slot)
+                continue
+
+            thumb = layout_thumb(frame) if reuse else None
+            if (
+                ref is not None
+                and sec - ref['sec'] <= LAYOUT_REUSE_MAX_SEC
+                and float(np.abs(thumb - ref['thumb']).mean()) <= LAYOUT_REUSE_MAX_DIFF
+            ):
+                slots.append({'ref': ref['slot'], 'source': 'reuse'})
+                continue
+
+            slot = {'detection': None, 'source': 'yolo'}
+            pending.append((sec, frame, slot))
+            if reuse:
+                ref = {'sec': sec, 'thumb': thumb, 'slot': slot}
+            slots.append(slot)
+
+        detections = run_yolo([frame for _, frame, _ in pending])
+        for (sec, _, slot), detection in zip(pending, detections):
+            slot['detection'] = detection
+            if cache is not None:
+                cache.set(sec, detection)
+
+        for (sec, frame), slot in zip(batch, slots):
+            if slot is None:
+                yield sec, frame, None
+                continue
+            detection = slot['ref']['detection'] if 'ref' in slot else slot['detection']
+            layout = build_layout(detection)
+            layout['layout_source'] = slot['source']
+            yield sec, frame, layout
+
+
+def detection_from_result(result, W, H):
     names = result.names
     screen_candidates = []
     host_candidates = []
@@ -286,17 +676,28 @@ def detect_layout(frame):
     screen_candidates = sorted(screen_candidates, key=lambda x: (box_area(x['box']), x['score']), reverse=True)
     host_candidates = sorted(host_candidates, key=lambda x: (box_area(x['box']), x['score']), reverse=True)
 
+    return {
+        'frame_size': [W, H],
+        'screen_box': list(screen_candidates[0]['box']) if screen_candidates else None,
+        'host_box': list(host_candidates[0]['box']) if host_candidates else None,
+    }
+
+
+def build_layout(detection):
+    W, H = detection['frame_size']
+    full_screen_box = (0, 0, W, H)
+
     screen_box = None
     host_box = None
     overlay_ratio = 0.0
     image_ratio = 0.0
     screen_box_ratio = 0.0
 
-    if screen_candidates:
-        screen_box = shrink_box(screen_candidates[0]['box'], W, H, ratio=0.02)
+    if detection['screen_box'] is not None:
+        screen_box = shrink_box(tuple(detection['screen_box']), W, H, ratio=0.02)
 
-    if host_candidates:
-        host_box = host_candidates[0]['box']
+    if detection['host_box'] is not None:
+        host_box = tuple(detection['host_box'])
         image_ratio = host_image_ratio(host_box, W, H)
 
 
@@ -321,15 +722,19 @@ def detect_layout(frame):
     }
 
 
-def ocr_frame(img):
+def upscale_for_ocr(img):
     if OCR_UPSCALE > 1:
-        img = img.resize(
-            (img.width * OCR_UPSCALE, img.height * OCR_UPSCALE),
-            Image.Resampling.LANCZOS,
+        h, w = img.shape[:2]
+        img = cv2.resize(
+            img,
+            (w * OCR_UPSCALE, h * OCR_UPSCALE),
+            interpolation=cv2.INTER_LANCZOS4,
         )
+    return np.ascontiguousarray(img)
 
-    arr = np.array(img)
-    ret, _ = get_ocr()(arr)
+
+def ocr_frame(img):
+    ret, _ = get_ocr()(upscale_for_ocr(img))
 
     if not ret:
         return ''
@@ -346,6 +751,87 @@ def ocr_frame(img):
     return '\n'.join(lines).strip()
 
 
+# RapidOCR's detection stage: one crop per text line, in the order ocr_frame recognises them
+def crop_text_lines(engine, img):
+    img = engine.load_img(img)
+    if hasattr(engine, 'preprocess'):
+        # rapidocr_onnxruntime >= 1.4 resizes first and records the letterbox
+        img, _, _ = engine.preprocess(img)
+        img, _ = engine.maybe_add_letterbox(img, {})
+    else:
+        img, _ = engine.maybe_add_letterbox(img)
+    dt_boxes, _ = engine.auto_text_det(img)
+    if dt_boxes is None:
+        return []
+    return engine.get_crop_img_list(img, dt_boxes)
+
+
+# lines no wider than the rec input pad to the same width in any batch, so only those are pooled across crops
+def rec_text_lines(engine, line_imgs, owners):
+    rec = engine.text_rec
+    _, img_h, img_w = rec.rec_image_shape[:3]
+    base_ratio = img_w / img_h
+
+    by_owner = {}
+    for i, owner in enumerate(owners):
+        by_owner.setdefault(owner, []).append(i)
+
+    pooled, own = [], []
+    for idx in by_owner.values():
+        ratios = np.array([line_imgs[i].shape[1] / float(line_imgs[i].shape[0]) for i in idx])
+        # the order and batches text_rec would use for this crop on its own
+        order = np.argsort(ratios)
+        for beg in range(0, len(order), rec.rec_batch_num):
+            batch = order[beg:beg + rec.rec_batch_num]
+            if ratios[batch].max() <= base_ratio:
+                pooled.extend(idx[j] for j in batch)
+            else:
+                own.append([idx[j] for j in batch])
+
+    rec_res = [None] * len(line_imgs)
+    for group in ([pooled] if pooled else []) + own:
+        res, _ = rec([line_imgs[i] for i in group])
+        for i, x in zip(group, res):
+            rec_res[i] = x
+    return rec_res
+
+
+# det per crop, cls/rec batched across crops; falls back to ocr_frame if RapidOCR hides its stages
+def ocr_frames(imgs):
+    if not imgs:
+        return []
+
+    engine = get_ocr()
+    stages = ('load_img', 'maybe_add_letterbox', 'auto_text_det', 'get_crop_img_list', 'text_cls', 'text_rec')
+    if not all(hasattr(engine, attr) for attr in stages) or not hasattr(engine.text_rec, 'rec_image_shape'):
+        return [ocr_frame(img) for img in imgs]
+
+    line_imgs = []
+    owners = []
+    for idx, img in enumerate(imgs):
+        crops = crop_text_lines(engine, upscale_for_ocr(img))
+        line_imgs.extend(crops)
+        owners.extend([idx] * len(crops))
+
+    lines = [[] for _ in imgs]
+    if not line_imgs:
+        return ['' for _ in imgs]
+
+    if engine.use_cls:
+        # cls resizes every line to a fixed width, so its batches are exact
+        line_imgs, _, _ = engine.text_cls(line_imgs)
+    rec_res = rec_text_lines(engine, line_imgs, owners)
+
+    min_score = getattr(engine, 'text_score', 0.5)
+    for idx, res in zip(owners, rec_res):
+        txt, score = str(res[0]).strip(), float(res[1])
+        if not txt or score < min_score:
+            continue
+        lines[idx].append(txt)
+
+    return ['\n'.join(x).strip() for x in lines]
+
+
 def keep_zh_lines(text):
     out = []
     for line in text.splitlines():
@@ -403,28 +889,142 @@ def build_data_entry(row):
     }
 
 
-def find_matching_data_entry(data, text_zh):
-    best_key = None
-    best_ratio = None
-    best_stats = None
-
-    for key, entry in data.items():
-        stats = ocr_char_match_ratio(entry['text_zh'], text_zh)
-        ratio = min(stats['new_in_old'], stats['old_in_new'])
-
-        if best_ratio is None or ratio > best_ratio:
-            best_key = key
-            best_ratio = ratio
-            best_stats = stats
-
-    return best_key, best_ratio, best_stats
-
-
-def find_sample_row(samples, hhmmss):
-    for sample in samples:
-        if sample.get('hhmmss') == hhmmss:
-            return sample
-    return None
+# ties resolve to the earliest added slide, matching the iteration order of the data dict
+class SlideIndex:
+    def __init__(self):
+        self.vocab = {}
+        self.counts = np.zeros((16, 256), dtype=np.int32)
+        self.lengths = np.zeros(16, dtype=np.int64)
+        self.active = np.zeros(16, dtype=bool)
+        self.keys = []
+        self.key2row = {}
+        self.texts = {}
+
+    def _reserve(self, n_rows, n_cols):
+        old_rows, old_cols = self.counts.shape
+        if n_rows <= old_rows and n_cols <= old_cols:
+            return
+        rows = old_rows if n_rows <= old_rows else max(n_rows, old_rows * 2)
+        cols = old_cols if n_cols <= old_cols else max(n_cols, old_cols * 2)
+
+        counts = np.zeros((rows, cols), dtype=np.int32)
+        counts[:old_rows, :old_cols] = self.counts
+        lengths = np.zeros(rows, dtype=np.int64)
+        lengths[:old_rows] = self.lengths
+        active = np.zeros(rows, dtype=bool)
+        active[:old_rows] = self.active
+        self.counts, self.lengths, self.active = counts, lengths, active
+
+    def add(self, key, text_zh):
+        self.remove(key)
+        text = ''.join(text_zh)
+        counter = Counter(text)
+        for ch in counter:
+            self.vocab.setdefault(ch, len(self.vocab))
+
+        row = len(self.keys)
+        self._reserve(row + 1, len(self.vocab))
+        cols = [self.vocab[ch] for ch in counter]
+        self.counts[row, :] = 0
+        self.counts[row, cols] = list(counter.values())
+        self.lengths[row] = len(text)
+        self.active[row] = True
+        self.keys.append(key)
+        self.key2row[key] = row
+        self.texts[key] = list(text_zh)
+
+    def remove(self, key):
+        row = self.key2row.pop(key, None)
+        if row is not None:
+            self.active[row] = False
+            self.texts.pop(key, None)
+
+    def match(self, text_zh):
+        n = len(self.keys)
+        if not self.key2row:
+            return None, None, None
+
+        new_text = ''.join(text_zh)
+        counter = Counter(ch for ch in new_text if ch in self.vocab)
+        cols = [self.vocab[ch] for ch in counter]
+        if cols:
+            wanted = np.fromiter(counter.values(), dtype=np.int32, count=len(cols))
+            matched = np.minimum(self.counts[:n, cols], wanted).sum(axis=1)
+        else:
+            matched = np.zeros(n, dtype=np.int64)
+
+        lengths = self.lengths[:n]
+        new_in_old = matched / len(new_text) if new_text else np.zeros(n)
+        old_in_new = np.divide(matched, lengths, out=np.zeros(n), where=lengths > 0)
+        ratio = np.minimum(new_in_old, old_in_new)
+        ratio[~self.active[:n]] = -np.inf
+
+        best_key = self.keys[int(np.argmax(ratio))]
+        best_stats = ocr_char_match_ratio(self.texts[best_key], text_zh)
+        best_ratio = min(best_stats['new_in_old'], best_stats['old_in_new'])
+        return best_key, best_ratio, best_stats
+
+
+class SlideTracker:
+    def __init__(self):
+        self.samples = []
+        self.sample_rows = {}
+        self.data = {}
+        self.index = SlideIndex()
+        self.prev_text = None
+
+    def add_sample(self, row):
+        self.samples.append(row)
+        self.sample_rows.setdefault(row['hhmmss'], row)
+
+    def _accept(self, row, text_raw, text_zh):
+        row_with_text = dict(row)
+        row_with_text['text_raw'] = text_raw
+        row_with_text['text_zh'] = text_zh
+        self.data[row['hhmmss']] = build_data_entry(row_with_text)
+        self.index.add(row['hhmmss'], text_zh)
+        self.prev_text = '\n'.join(text_zh)
+
+    def add_text(self, row, text_raw):
+        text_zh = keep_zh_lines(text_raw)
+        if not text_zh:
+            return
+
+        now_text = '\n'.join(text_zh)
+        if now_text == self.prev_text:
+            return
+
+        match_key, match_ratio, match_stats = self.index.match(text_zh)
+        # get best match ratio
+        if match_key is not None and match_stats is not None:
+            row['ocr_match_found'] = True
+            row['ocr_match_hhmmss'] = match_key
+            row['ocr_match_ratio'] = match_ratio
+            row['ocr_match_new_in_old'] = match_stats['new_in_old']
+            row['ocr_match_old_in_new'] = match_stats['old_in_new']
+
+        # if match ratio > threshold, slide exist previously
+        if (
+            match_key is not None
+            and match_stats is not None
+            and match_ratio is not None
+            and match_ratio >= OCR_CHAR_MATCH_RATIO_THRESHOLD
+        ):
+            old_entry = self.data[match_key]
+            if row['quality_is_fullscreen'] and not old_entry.get('quality_is_fullscreen'):
+                old_row = self.sample_rows.get(match_key)
+                if old_row is not None:
+                    old_row['remark'] = f'duplicate_replaced_by_{row["hhmmss"]}'
+                    old_row['replaced_by'] = row['hhmmss']
+                row['remark'] = f'duplicate_replacement_of_{match_key}'
+                row['replaces'] = match_key
+                self.data.pop(match_key, None)
+                self.index.remove(match_key)
+                self._accept(row, text_raw, text_zh)
+            else:
+                row['remark'] = f'duplicate_of_{match_key}'
+        else:
+            self._accept(row, text_raw, text_zh)
 
 
 def save_debug_pair(dt, sec, prev_frame, frame, diff_ratio):
@@ -444,7 +1044,7 @@ def save_debug_pair(dt, sec, prev_frame, frame, diff_ratio):
     curr_path = f'{debug_dir}/{hhmmss}_curr_diff_{diff_str}.png'
 
     # prev_frame.save(prev_path) # disable, redundant
-    frame.save(curr_path)
+    Image.fromarray(frame).save(curr_path)
 
 
 def save_debug_crop(dt, sec, crop, replace=False):
@@ -455,12 +1055,12 @@ def save_debug_crop(dt, sec, crop, replace=False):
     os.makedirs(debug_dir, exist_ok=True)
     hhmmss = sec_to_hhmmss(sec).replace(':', '')
     crop_path = f'{debug_dir}/{hhmmss}_crop{"_r" if replace else ""}.png'
-    crop.save(crop_path)
+    Image.fromarray(crop).save(crop_path)
 
 
 def crop_by_box(img, box):
     x0, y0, x1, y1 = box
-    return img.crop((x0, y0, x1, y1))
+    return img[y0:y1, x0:x1]
 
 
 def save_debug_box(dt, sec, frame, layout):
@@ -472,7 +1072,7 @@ def save_debug_box(dt, sec, frame, layout):
     hhmmss = sec_to_hhmmss(sec).replace(':', '')
     box_path = f'{debug_dir}/{hhmmss}_box.png'
 
-    arr = np.array(frame).copy()
+    arr = frame.copy()
     screen_box = layout.get('screen_box')
     host_box = layout.get('host_box')
     overlay_ratio = layout.get('host_overlay_ratio', 0.0)
@@ -488,101 +1088,128 @@ def save_debug_box(dt, sec, frame, layout):
     Image.fromarray(arr).save(box_path)
 
 
-def process_video(video_path):
-
-    if '【' not in video_path:
-        return
-
-    dt = re.findall(r'【\d+】', video_path)[0]
-    FOUT = str(ROOT / 'ocr' / 'json' / f'{dt}.json')
-    FOUT2 = str(ROOT / 'ocr' / 'text' / f'{dt}.txt')
-    debug_dir = str(ROOT / 'ocr' / 'debug' / dt)
+def compare_frames(prev_frame, prev_screen_box, prev_hash, frame, screen_box):
+    size = frame_size(frame)
+    ret = {
+        'changed': False,
+        'crop_rescaled': CropRescaled.NONE,
+        'diff_ratio2': None,
+        'hash_distance': None,
+        'change_tier': None,
+        'curr_hash': None,
+    }
+    if prev_frame is None:
+        ret['changed'] = True
+        ret['change_tier'] = 'first'
+        return ret
+
+    if prev_screen_box is not None and screen_box is not None:
+        prev_crop = crop_by_box(prev_frame, prev_screen_box)
+        curr_crop = crop_by_box(frame, screen_box)
+        if frame_size(curr_crop) == size and frame_size(prev_crop) != size:
+            prev_crop = cv2.resize(prev_crop, size, interpolation=cv2.INTER_LINEAR)
+            ret['crop_rescaled'] = CropRescaled.CLEARER
+        elif frame_size(curr_crop) != size and frame_size(prev_crop) == size:
+            curr_crop = cv2.resize(curr_crop, size, interpolation=cv2.INTER_LINEAR)
+            ret['crop_rescaled'] = CropRescaled.BLURRIER
+
+        # rescaled crops keep their own matchTemplate threshold
+        if CHANGE_HASH_TIER and ret['crop_rescaled'] == CropRescaled.NONE and prev_hash is not None:
+            ret['curr_hash'] = dhash(curr_crop)
+            ret['hash_distance'] = hash_distance(prev_hash, ret['curr_hash'])
+            if ret['hash_distance'] <= CHANGE_HASH_SAME_MAX:
+                ret['changed'] = False
+                ret['change_tier'] = 'hash'
+            elif ret['hash_distance'] >= CHANGE_HASH_CHANGED_MIN:
+                ret['changed'] = True
+                ret['change_tier'] = 'hash'
+
+        if ret['change_tier'] is None or CHANGE_HASH_VERIFY:
+            ret['diff_ratio2'] = image_diff_ratio2(prev_crop, curr_crop)
+    else:
+        ret['diff_ratio2'] = image_diff_ratio2(prev_frame, frame)
 
-    if not DEBUG and os.path.exists(FOUT) and os.path.getsize(FOUT) > 0:
-        return
+    if ret['change_tier'] is None:
+        ret['change_tier'] = 'template'
+        if ret['crop_rescaled'] != CropRescaled.NONE:
+            ret['changed'] = ret['diff_ratio2'] < RESCALED_SLIDE_MATCH_THRESHOLD
+        else:
+            ret['changed'] = ret['diff_ratio2'] < SLIDE_MATCH_THRESHOLD
+    return ret
 
-    # force reset delete entire folder, save debug frame only remove folder at runtime
-    if SAVE_DEBUG_FRAME and os.path.isdir(debug_dir):
-        shutil.rmtree(debug_dir)
 
-    file_start = time.perf_counter()
-    if VERBOSE:
-        print('OCR %s ... this may take a while.' % dt)
+def needs_ocr(row):
+    return row['skip_reason'] is None and (row['changed'] or row['crop_rescaled'] == CropRescaled.CLEARER)
 
-    duration = get_duration(video_path)
 
-    samples = []
-    data = {}
+# with keep_boundary also returns the first and last accepted frames for reduce_segments
+def scan_segment(video_path, dt, secs, keep_boundary=False):
+    rows = []
+    texts = {}
+    pending_ocr = []
     prev_frame = None
     prev_screen_box = None
-    prev_text = None
-
-    secs = list(range(STEP_SEC, int(duration) + 1, STEP_SEC))
-    sec_iter = secs if not SHOW_FRAME_TQDM else tqdm(secs, desc=dt, unit='frame')
-    for sec in sec_iter:
-        try:
-            frame = extract_frame(video_path, sec)
-        except Exception as e:
-            samples.append({
+    prev_hash = None
+    first = None
+    last_hhmmss = None
+
+    def flush_ocr():
+        for (row, _), text_raw in zip(pending_ocr, ocr_frames([crop for _, crop in pending_ocr])):
+            texts[row['hhmmss']] = text_raw
+        pending_ocr.clear()
+
+    if STREAM_FRAMES:
+        # every frame in flight (current batch, queued and decoding) needs its own buffer
+        n_buffers = (PREFETCH_BATCHES + 2) * YOLO_BATCH
+        frame_iter = iter_frames(video_path, secs, n_buffers=n_buffers)
+    else:
+        frame_iter = iter_frames_by_seek(video_path, secs)
+    layout_cache = LayoutCache(dt) if LAYOUT_CACHE else None
+    layout_iter = iter_layouts(frame_iter, YOLO_BATCH, cache=layout_cache, reuse=LAYOUT_REUSE)
+    if SHOW_FRAME_TQDM:
+        layout_iter = tqdm(layout_iter, total=len(secs), desc=dt, unit='frame')
+    for sec, frame, layout in layout_iter:
+        if isinstance(frame, Exception):
+            rows.append({
                 'sec': sec,
                 'hhmmss': sec_to_hhmmss(sec),
-                'error': str(e),
+                'error': str(frame),
             })
             continue
 
-        diff_ratio2 = None
-        changed = False
-        layout = detect_layout(frame)
+        size = frame_size(frame)
         screen_box = layout['screen_box']
         host_box = layout['host_box']
         overlay_ratio = layout['host_overlay_ratio']
         image_ratio = layout['host_image_ratio']
         screen_box_ratio = layout['screen_box_ratio']
-
-        crop_rescaled = CropRescaled.NONE
-        if prev_frame is None:
-            changed = True
-        else:
-
-            if prev_screen_box is not None and screen_box is not None:
-                prev_crop = crop_by_box(prev_frame, prev_screen_box)
-                curr_crop = crop_by_box(frame, screen_box)
-                if curr_crop.size == frame.size and prev_crop.size != frame.size:
-                    prev_crop =  Image.fromarray(cv2.resize(np.array(prev_crop), frame.size, interpolation=cv2.INTER_LINEAR))
-                    crop_rescaled = CropRescaled.CLEARER
-                elif curr_crop.size != frame.size and prev_crop.size == frame.size:
-                    curr_crop =  Image.fromarray(cv2.resize(np.array(curr_crop), frame.size, interpolation=cv2.INTER_LINEAR))
-                    crop_rescaled = CropRescaled.BLURRIER
-
-                diff_ratio2 = image_diff_ratio2(prev_crop, curr_crop)
-            else:
-                diff_ratio2 = image_diff_ratio2(prev_frame, frame)
-
-            if crop_rescaled != CropRescaled.NONE:
-                changed = diff_ratio2 < RESCALED_SLIDE_MATCH_THRESHOLD
-            else:
-                changed = diff_ratio2 < SLIDE_MATCH_THRESHOLD
-
+        change = compare_frames(prev_frame, prev_screen_box, prev_hash, frame, screen_box)
+        changed = change['changed']
+        crop_rescaled = change['crop_rescaled']
+        diff_ratio2 = change['diff_ratio2']
 
         row = {
                 'sec': sec,
                 'hhmmss': sec_to_hhmmss(sec),
                 'diff_ratio2': diff_ratio2,
+                'hash_distance': change['hash_distance'],
+                'change_tier': change['change_tier'],
                 'crop_rescaled': int(crop_rescaled),
                 'screen_box': screen_box,
                 'host_box': host_box,
                 'host_overlay_ratio': overlay_ratio,
                 'host_image_ratio': image_ratio,
                 'screen_box_ratio': screen_box_ratio,
+                'layout_source': layout['layout_source'],
                 'remark': '',
                 'changed' : changed,
-                'frame_size': frame.size,
+                'frame_size': size,
                 'ocr_match_found': False,
                 'ocr_match_hhmmss': None,
                 'ocr_match_ratio': None,
                 'ocr_match_new_in_old': None,
                 'ocr_match_old_in_new': None,
-                'quality_is_fullscreen': is_fullscreen_box(screen_box, frame.size),
+                'quality_is_fullscreen': is_fullscreen_box(screen_box, size),
                 'replaced_by': None,
                 'replaces': None,
         }
@@ -598,83 +1225,156 @@ def process_video(video_path):
 
         row['skip_reason'] = skip_reason
         # skip_reason = None
-        if skip_reason is None:
-            if changed or (crop_rescaled == CropRescaled.CLEARER):
-                save_debug_box(dt, sec, frame, layout)
-                save_debug_pair(dt, sec, prev_frame, frame, diff_ratio2)
-                frame2 = crop_by_box(frame, screen_box)
-                save_debug_crop(dt, sec, frame2, not changed)
-                text_raw = ocr_frame(frame2)
-                text_zh = keep_zh_lines(text_raw)
-
-                if text_zh:
-                    now_text = '\n'.join(text_zh)
-                    if now_text != prev_text:
-                        match_key, match_ratio, match_stats = find_matching_data_entry(data, text_zh)
-                        # get best match ratio
-                        if match_key is not None and match_stats is not None:
-                            row['ocr_match_found'] = True
-                            row['ocr_match_hhmmss'] = match_key
-                            row['ocr_match_ratio'] = match_ratio
-                            row['ocr_match_new_in_old'] = match_stats['new_in_old']
-                            row['ocr_match_old_in_new'] = match_stats['old_in_new']
-
-                        # if match ratio > threshold, slide exist previously
-                        if (
-                            match_key is not None
-                            and match_stats is not None
-                            and match_ratio is not None
-                            and match_ratio >= OCR_CHAR_MATCH_RATIO_THRESHOLD
-                        ):
-                            old_entry = data[match_key]
-                            if row['quality_is_fullscreen'] and not old_entry.get('quality_is_fullscreen'):
-                                old_row = find_sample_row(samples, match_key)
-                                if old_row is not None:
-                                    old_row['remark'] = f'duplicate_replaced_by_{row["hhmmss"]}'
-                                    old_row['replaced_by'] = row['hhmmss']
-                                row['remark'] = f'duplicate_replacement_of_{match_key}'
-                                row['replaces'] = match_key
-                                data.pop(match_key, None)
-                                row_with_text = dict(row)
-                                row_with_text['text_raw'] = text_raw
-                                row_with_text['text_zh'] = text_zh
-                                data[row['hhmmss']] = build_data_entry(row_with_text)
-                                prev_text = now_text
-                            else:
-                                row['remark'] = f'duplicate_of_{match_key}'
-                        else:
-                            row_with_text = dict(row)
-                            row_with_text['text_raw'] = text_raw
-                            row_with_text['text_zh'] = text_zh
-                            data[row['hhmmss']] = build_data_entry(row_with_text)
-                            prev_text = now_text
-            
-                prev_frame = frame
-                prev_screen_box = screen_box
-
-        samples.append(row)
+        if needs_ocr(row):
+            save_debug_box(dt, sec, frame, layout)
+            save_debug_pair(dt, sec, prev_frame, frame, diff_ratio2)
+            frame2 = crop_by_box(frame, screen_box)
+            save_debug_crop(dt, sec, frame2, not changed)
+            # OCR is deferred to a batch; the crop must outlive the decode buffer
+            pending_ocr.append((row, frame2.copy()))
+
+            # frame lives in a reused decode buffer
+            prev_frame = frame.copy()
+            prev_screen_box = screen_box
+            prev_hash = change['curr_hash'] if change['curr_hash'] is not None else dhash(frame2)
+            last_hhmmss = row['hhmmss']
+            if keep_boundary and first is None:
+                first = {'hhmmss': row['hhmmss'], 'frame': prev_frame, 'screen_box': screen_box}
+
+        rows.append(row)
+        if len(pending_ocr) >= OCR_BATCH:
+            flush_ocr()
+
+    if pending_ocr:
+        flush_ocr()
+
+    last = None
+    if keep_boundary and prev_frame is not None:
+        last = {'hhmmss': last_hhmmss, 'frame': prev_frame, 'screen_box': prev_screen_box, 'hash': prev_hash}
+
+    return {
+        'rows': rows,
+        'texts': texts,
+        'layouts': layout_cache.data if layout_cache is not None and layout_cache.dirty else {},
+        'first': first,
+        'last': last,
+    }
+
+
+# a segment's first accepted frame is re-compared with the last one before it and dropped if unchanged
+def reduce_segments(segments):
+    tracker = SlideTracker()
+    last = None
+    for segment in segments:
+        first = segment['first']
+        dropped = False
+        if first is not None and last is not None:
+            change = compare_frames(last['frame'], last['screen_box'], last['hash'], first['frame'], first['screen_box'])
+            for row in segment['rows']:
+                if row['hhmmss'] != first['hhmmss']:
+                    continue
+                row['changed'] = change['changed']
+                row['crop_rescaled'] = int(change['crop_rescaled'])
+                row['diff_ratio2'] = change['diff_ratio2']
+                row['hash_distance'] = change['hash_distance']
+                row['change_tier'] = change['change_tier']
+                if not needs_ocr(row):
+                    segment['texts'].pop(row['hhmmss'], None)
+                    dropped = True
+                break
+
+        for row in segment['rows']:
+            tracker.add_sample(row)
+            if row['hhmmss'] in segment['texts']:
+                tracker.add_text(row, segment['texts'][row['hhmmss']])
+
+        if segment['last'] is not None and not (dropped and segment['last']['hhmmss'] == first['hhmmss']):
+            last = segment['last']
+    return tracker
+
+
+def split_secs(secs, n_shards):
+    n_shards = max(1, min(n_shards, len(secs)))
+    size = -(-len(secs) // n_shards)
+    return [secs[i:i + size] for i in range(0, len(secs), size)]
+
+
+def scan_shard(task):
+    idx, video_path, dt, secs = task
+    return idx, scan_segment(video_path, dt, secs, keep_boundary=True)
+
+
+def process_video(video_path, n_shards=1, pool=None):
+    if '【' not in video_path:
+        return
 
+    dt = re.findall(r'【\d+】', video_path)[0]
+    FOUT = str(ROOT / 'ocr' / 'json' / f'{dt}.json')
+    FOUT2 = str(ROOT / 'ocr' / 'text' / f'{dt}.txt')
+    debug_dir = str(ROOT / 'ocr' / 'debug' / dt)
+
+    if not DEBUG and os.path.exists(FOUT) and os.path.getsize(FOUT) > 0:
+        return
+
+    # force reset delete entire folder, save debug frame only remove folder at runtime
+    if SAVE_DEBUG_FRAME and os.path.isdir(debug_dir):
+        shutil.rmtree(debug_dir)
+
+    file_start = time.perf_counter()
+    if VERBOSE:
+        print('OCR %s ... this may take a while.' % dt)
+
+    duration = get_duration(video_path)
+    secs = pick_sample_secs(video_path, duration)
+
+    shards = split_secs(secs, n_shards)
+    if len(shards) <= 1:
+        segments = [scan_segment(video_path, dt, secs)]
+    elif pool is not None:
+        tasks = [(i, video_path, dt, shard) for i, shard in enumerate(shards)]
+        segments = [x[1] for x in sorted(pool.imap_unordered(tasks), key=lambda x: x[0])]
+    else:
+        ctx = mp.get_context('spawn')
+        with ctx.Pool(len(shards)) as pool:
+            segments = pool.starmap(scan_segment, [(video_path, dt, shard, True) for shard in shards])
+
+    if LAYOUT_CACHE:
+        layout_cache = LayoutCache(dt)
+        for segment in segments:
+            for sec, detection in segment['layouts'].items():
+                layout_cache.set(sec, detection)
+        layout_cache.save()
+
+    tracker = reduce_segments(segments)
 
     with open(FOUT, 'w', encoding='utf-8') as ofile:
         json.dump({
             'video_path': video_path,
             'dt': dt,
             'step_sec': STEP_SEC,
+            'sampling': {
+                'mode': SAMPLING,
+                'n_samples': len(secs),
+                'frames_per_hour': ADAPTIVE_FRAMES_PER_HOUR if SAMPLING == 'adaptive' else 3600 / STEP_SEC,
+            },
             'ratio': {
                 'slide_match_threshold': SLIDE_MATCH_THRESHOLD,
+                'change_hash_tier': CHANGE_HASH_TIER,
+                'change_hash_same_max': CHANGE_HASH_SAME_MAX,
+                'change_hash_changed_min': CHANGE_HASH_CHANGED_MIN,
                 'rescaled_slide_match_threshold': RESCALED_SLIDE_MATCH_THRESHOLD,
                 'ocr_char_match_ratio_threshold': OCR_CHAR_MATCH_RATIO_THRESHOLD,
                 'box_screen_ratio_threshold': BOX_SCREEN_RATIO_THRESHOLD,
                 'host_overlay_max': HOST_OVERLAY_MAX,
                 'host_image_ratio_threshold': HOST_IMAGE_RATIO_THRESHOLD,
             },
-            'samples': samples,
-            'data': dict(sorted(data.items())),
+            'samples': tracker.samples,
+            'data': dict(sorted(tracker.data.items())),
         }, ofile, ensure_ascii=False, indent=2)
 
     with open(FOUT2, 'w', encoding='utf-8') as ofile:
-        for hhmmss in sorted(data):
-            row = data[hhmmss]
+        for hhmmss in sorted(tracker.data):
+            row = tracker.data[hhmmss]
             if not row.get('text_zh'):
                 continue
             ofile.write('[%s]\n' % row['hhmmss'])
@@ -712,6 +1412,7 @@ if __name__ == '__main__':
         video_paths = [x for x in video_paths if '20240117' in x]
         SAVE_DEBUG_FRAME =True
         N_WORKERS = 1
+        STREAM_FRAMES = False
         VERBOSE =True
         SHOW_FRAME_TQDM = True
     else:
@@ -729,6 +1430,15 @@ if __name__ == '__main__':
     if N_WORKERS <= 1:
         for video_path in video_paths:
             process_video(video_path)
+    elif SHARD_SMALL_RUNS and len(video_paths) < N_WORKERS:
+        with WarmPool(N_WORKERS, scan_shard, warmup=warm_models, max_rss_mb=MAX_WORKER_RSS_MB) as pool:
+            for video_path in tqdm(video_paths, desc='videos', unit='video'):
+                process_video(video_path, n_shards=N_WORKERS, pool=pool)
+        print(pool.format_stats())
+    elif WARM_POOL:
+        with WarmPool(N_WORKERS, process_video, warmup=warm_models, max_rss_mb=MAX_WORKER_RSS_MB) as pool:
+            list(tqdm(pool.imap_unordered(video_paths), total=len(video_paths), desc='videos', unit='video'))
+        print(pool.format_stats())
     else:
         ctx = mp.get_context('spawn')
         with ctx.Pool(N_WORKERS, maxtasksperchild=MAX_TASKS_PER_CHILD) as pool:
@@ -9,23 +9,24 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from faster_whisper import WhisperModel
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from concurrent.futures import ThreadPoolExecutor
 import glob
+import itertools
+import json
 import logging
 import multiprocessing as mp
 import os
 import re
 import time
 import torch
-from src.transcript.normalize_transcript import NormFinder
+from src.audio_cache import evict_audio, extract_audio, is_cached, load_audio
+from src.transcript.clean_transcript import clean_transcripts
+from src.transcript.segment_table import SegmentTable
+from src.worker_pool import WarmPool
 from tqdm import tqdm
 import shutil
 
-nf = NormFinder("")
-
-if not torch.cuda.is_available():
-    raise RuntimeError("No CUDA device available - cannot run on GPU.")
-
 root = logging.getLogger()
 root.setLevel(logging.INFO)
 
@@ -46,22 +47,61 @@ logging.getLogger("huggingface_hub").setLevel(logging.ERROR)
 MODEL_SIZE = "large-v3-turbo"
 MODEL_DOWNLOAD_ROOT = str(ROOT / "models" / "faster-whisper")
 MODEL_LOCAL_FILES_ONLY = False
-MODEL_DEVICE = "cuda"
-MODEL_COMPUTE_TYPE = "float16"
+# pick per run with TRANSCRIBE_BACKEND=cuda|cpu; cpu is CTranslate2 int8
+BACKENDS = {
+    "cuda": {"device": "cuda", "compute_type": "float16"},
+    "cpu": {"device": "cpu", "compute_type": "int8"},
+}
+BACKEND = os.getenv("TRANSCRIBE_BACKEND", "cuda")
+MODEL_DEVICE = BACKENDS[BACKEND]["device"]
+MODEL_COMPUTE_TYPE = BACKENDS[BACKEND]["compute_type"]
+# threads per worker on cpu; 0 splits the cores evenly across N_WORKERS
+CPU_THREADS = 0
+BENCHMARK_SECONDS = 600
 BEAM_SIZE = 5
 TRANSCRIBE_LANGUAGE = "zh"
 TRANSCRIBE_VAD_FILTER = True
+# "sequential" decodes the whole file one window at a time; "batched" splits it
+# into VAD speech regions and decodes BATCH_SIZE regions per model call
+TRANSCRIBE_MODE = "sequential"
+BATCH_SIZE = 16
 
 RAW_DIR = str(ROOT / "transcripts" / "raw")
+# 16 kHz mono PCM decoded once per video and reused when a crashed video resumes;
+# removed once its raw transcript is written unless KEEP_AUDIO_CACHE (parameter sweeps)
+AUDIO_CACHE = True
+AUDIO_CACHE_DIR = str(ROOT / "transcripts" / "audio")
+KEEP_AUDIO_CACHE = False
+AUDIO_EXTRACT_WORKERS = 4
+# videos decoded ahead of the ones being transcribed; bounds the .npy files on disk
+AUDIO_PREFETCH_AHEAD = 4
 CLEAN_DIR = str(ROOT / "transcripts" / "clean")
+# raw content + cleaner hash of every clean output; kept outside CLEAN_DIR since
+# downstream steps glob transcripts/clean/*
+CLEAN_MANIFEST = str(ROOT / "transcripts" / "clean_manifest.json")
+CLEAN_WRAP_WIDTH = 60
+# cleaning is cheap per file; more processes than this only add spawn overhead
+N_CLEAN_WORKERS = min(os.cpu_count() or 1, 8)
+# append-only per-segment progress, so a crashed video resumes from its last segment
+CHECKPOINT_DIR = str(ROOT / "transcripts" / "checkpoints")
+# per-episode start/end/text offsets/avg_logprob of every segment in the raw text
+SEGMENT_DIR = str(ROOT / "transcripts" / "segments")
 
 N_WORKERS = 4
 MAX_TASKS_PER_CHILD = 1
+# keep workers (and their loaded Whisper model) across videos; recycle a worker
+# only once its RSS after a video exceeds MAX_WORKER_RSS_MB
+WARM_POOL = True
+MAX_WORKER_RSS_MB = 16000
 VERBOSE = False
 DEBUG = 0
 FORCE_RESET = 0
 
+if MODEL_DEVICE == "cuda" and not torch.cuda.is_available():
+    raise RuntimeError("No CUDA device available - cannot run on GPU (set TRANSCRIBE_BACKEND=cpu).")
+
 model = None
+batched_model = None
 
 
 def get_cached_model_dir():
@@ -89,44 +129,145 @@ def get_cached_model_dir():
 
     return None
 
+def get_cpu_threads(n_workers=None):
+    if CPU_THREADS > 0:
+        return CPU_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, n_workers or N_WORKERS))
+
+
+def load_model(backend=BACKEND):
+    model_source = get_cached_model_dir() or MODEL_SIZE
+    if VERBOSE:
+        print(f"Loading Whisper model: {model_source} ({backend})")
+        print(f"Whisper download_root: {MODEL_DOWNLOAD_ROOT}")
+    kwargs = dict(BACKENDS[backend])
+    if kwargs["device"] == "cpu":
+        kwargs["cpu_threads"] = get_cpu_threads()
+    if model_source == MODEL_SIZE:
+        kwargs["download_root"] = MODEL_DOWNLOAD_ROOT
+        kwargs["local_files_only"] = MODEL_LOCAL_FILES_ONLY
+    return WhisperModel(model_source, **kwargs)
+
+
 def get_model():
     global model
     if model is None:
-        model_source = get_cached_model_dir() or MODEL_SIZE
-        if VERBOSE:
-            print(f"Loading Whisper model: {model_source}")
-            print(f"Whisper download_root: {MODEL_DOWNLOAD_ROOT}")
-        kwargs = {
-            "device": MODEL_DEVICE,
-            "compute_type": MODEL_COMPUTE_TYPE,
-        }
-        if model_source == MODEL_SIZE:
-            kwargs["download_root"] = MODEL_DOWNLOAD_ROOT
-            kwargs["local_files_only"] = MODEL_LOCAL_FILES_ONLY
-        model = WhisperModel(model_source, **kwargs)
+        model = load_model()
     return model
 
-def wrap_by_whitespace(text: str, max_len: int = 30) -> str:
-    tokens = re.findall(r"\S+", text)
 
+def benchmark_backends(video_path, backends=None, seconds=BENCHMARK_SECONDS):
+    """Transcribe the first seconds of video_path on each backend.
+
+    Returns {backend: audio-seconds transcribed per wall-second}. Model load
+    time is excluded; on cpu the per-worker thread count is used.
+    """
+    if backends is None:
+        backends = [x for x in BACKENDS if x != "cuda" or torch.cuda.is_available()]
+
+    audio = decode_audio(video_path)[: int(seconds * 16000)]
+    audio_sec = len(audio) / 16000
+    ret = {}
+    for backend in backends:
+        bench_model = load_model(backend)
+        start = time.perf_counter()
+        segments, _ = bench_model.transcribe(
+            audio,
+            beam_size=BEAM_SIZE,
+            vad_filter=TRANSCRIBE_VAD_FILTER,
+            language=TRANSCRIBE_LANGUAGE,
+        )
+        for _ in segments:
+            pass
+        wall = time.perf_counter() - start
+        ret[backend] = audio_sec / wall if wall > 0 else float("inf")
+        print(f"{backend}: {audio_sec:.0f}s audio in {wall:.1f}s -> {ret[backend]:.2f} audio-s/wall-s")
+        del bench_model
+    return ret
+
+def get_batched_model():
+    global batched_model
+    if batched_model is None:
+        batched_model = BatchedInferencePipeline(model=get_model())
+    return batched_model
+
+
+def transcribe(audio):
+    if TRANSCRIBE_MODE == "batched":
+        return get_batched_model().transcribe(
+            audio,
+            beam_size=BEAM_SIZE,
+            vad_filter=True,
+            language=TRANSCRIBE_LANGUAGE,
+            batch_size=BATCH_SIZE,
+        )
+    return get_model().transcribe(
+        audio,
+        beam_size=BEAM_SIZE,
+        vad_filter=TRANSCRIBE_VAD_FILTER,
+        language=TRANSCRIBE_LANGUAGE,
+    )
+
+
+def join_segment_spans(texts):
+    """Join texts by newline; also return (index, text_start, text_end) of the kept ones."""
     lines = []
-    current = ""
+    spans = []
+    pos = 0
+    for idx, text in enumerate(texts):
+        text = text.strip() if text else ""
+        if text:
+            if lines:
+                pos += 1
+            spans.append((idx, pos, pos + len(text)))
+            pos += len(text)
+            lines.append(text)
+    return "\n".join(lines), spans
+
+
+def get_checkpoint_params():
+    # a checkpoint written with other decoding settings is not resumed
+    return {
+        "model": MODEL_SIZE,
+        "mode": TRANSCRIBE_MODE,
+        "beam_size": BEAM_SIZE,
+        "language": TRANSCRIBE_LANGUAGE,
+        "vad_filter": TRANSCRIBE_VAD_FILTER,
+    }
+
+
+def read_checkpoint(path):
+    """Return the segments completed so far, [] if missing or stale."""
+    if not os.path.exists(path):
+        return []
+    segments = []
+    with open(path, "r", encoding="utf-8") as ifile:
+        for i, line in enumerate(ifile):
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # torn last line from a killed process
+                break
+            if i == 0:
+                if row.get("params") != get_checkpoint_params():
+                    return []
+                continue
+            segments.append(row)
+    return segments
 
-    for tok in tokens:
-        if not current:
-            current = tok
-        else:
-            candidate = current + " " + tok
-            if len(candidate) <= max_len:
-                current = candidate
-            else:
-                lines.append(current)
-                current = tok
 
-    if current:
-        lines.append(current)
+def write_checkpoint(path, segments):
+    """Rewrite path as the params header plus segments, atomically."""
+    with open(path + ".tmp", "w", encoding="utf-8") as ofile:
+        ofile.write(json.dumps({"params": get_checkpoint_params()}) + "\n")
+        for row in segments:
+            ofile.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(path + ".tmp", path)
+
 
-    return "\n".join(lines)
+def get_resume_sec(dt):
+    segments = read_checkpoint(os.path.join(CHECKPOINT_DIR, f"{dt}.jsonl"))
+    return segments[-1]["end"] if segments else 0.0
 
 
 def process_video(video_path):
@@ -143,52 +284,78 @@ def process_video(video_path):
     if os.path.exists(clean_out):
         os.remove(clean_out)
 
+    checkpoint = os.path.join(CHECKPOINT_DIR, f"{dt}.jsonl")
+    done = [] if DEBUG else read_checkpoint(checkpoint)
+    resume_sec = done[-1]["end"] if done else 0.0
+
     file_start = time.perf_counter()
     if VERBOSE:
-        print(f"Transcribing {dt} ... this may take a while.")
+        if resume_sec:
+            print(f"Resuming {dt} from {resume_sec:.1f}s ({len(done)} segments checkpointed).")
+        else:
+            print(f"Transcribing {dt} ... this may take a while.")
 
-    segments, info = get_model().transcribe(
-        video_path,
-        beam_size=BEAM_SIZE,
-        vad_filter=TRANSCRIBE_VAD_FILTER,
-        language=TRANSCRIBE_LANGUAGE,
-    )
+    if AUDIO_CACHE:
+        audio = load_audio(extract_audio(video_path, AUDIO_CACHE_DIR, dt), start_sec=resume_sec)
+    else:
+        audio = decode_audio(video_path)[int(resume_sec * 16000):]
+    segments, info = transcribe(audio)
 
     if VERBOSE:
         print(f"Detected language: {info.language} ({info.language_probability:.2%})")
 
-    joined_text = "\n".join(
-        segment.text.strip()
-        for segment in segments
-        if segment.text and segment.text.strip()
-    )
-
-    with open(fout, "w", encoding="utf-8") as ofile:
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    # start from exactly the rows read back, so a torn last line from the
+    # killed run is dropped instead of having new rows appended after it
+    write_checkpoint(checkpoint, done)
+    with open(checkpoint, "a", encoding="utf-8") as ofile:
+        for segment in segments:
+            row = {
+                "start": round(resume_sec + segment.start, 3),
+                "end": round(resume_sec + segment.end, 3),
+                "text": segment.text,
+                "avg_logprob": segment.avg_logprob,
+            }
+            ofile.write(json.dumps(row, ensure_ascii=False) + "\n")
+            ofile.flush()
+            done.append(row)
+
+    joined_text, spans = join_segment_spans([x["text"] for x in done])
+    SegmentTable.from_rows(done, spans).save(os.path.join(SEGMENT_DIR, f"{dt.strip('【】')}.npz"))
+
+    with open(fout + ".tmp", "w", encoding="utf-8") as ofile:
         ofile.write(joined_text)
+    os.replace(fout + ".tmp", fout)
+    os.remove(checkpoint)
+    if AUDIO_CACHE and not KEEP_AUDIO_CACHE:
+        evict_audio(AUDIO_CACHE_DIR, dt)
 
     file_end = time.perf_counter()
     if VERBOSE:
-        print(f"  Finished {video_path} in {file_end - file_start:.2f} seconds.\n")
+        elapsed = file_end - file_start
+        print(f"  Finished {video_path} in {elapsed:.2f} seconds ({info.duration / elapsed:.2f} audio-s/wall-s on {BACKEND}).\n")
 
 
-def clean_transcript_file(transcript_path):
-    with open(transcript_path, "r", encoding="utf-8") as ifile:
-        transcript_raw = ifile.read()
-
-    if not transcript_raw.strip():
+def prefetch_audio(executor, pending, n=1):
+    """Submit the next n videos of the pending iterator for audio extraction."""
+    if executor is None:
         return
+    for video_path in itertools.islice(pending, n):
+        executor.submit(extract_audio_for, video_path)
 
-    transcript_path2 = re.findall(r"\d+", transcript_path)[0]
-    out_file = os.path.join(CLEAN_DIR, f"{transcript_path2}.txt")
-
-    if os.path.exists(out_file) and os.path.getsize(out_file) > 0:
-        return
 
-    transcript_clean = nf.normalize_zh_transcript(transcript_raw)
-    transcript_clean2 = wrap_by_whitespace(transcript_clean, 60)
-
-    with open(out_file, "w", encoding="utf-8") as ofile:
-        ofile.write(transcript_clean2)
+def extract_audio_for(video_path):
+    dt = re.findall(r"【\d+】", video_path)[0]
+    fout = os.path.join(RAW_DIR, f"{dt}.txt")
+    # already transcribed (and evicted) by the time the prefetch got here
+    if os.path.exists(fout) and os.path.getsize(fout) > 0:
+        return None
+    npy_path = extract_audio(video_path, AUDIO_CACHE_DIR, dt)
+    # a worker that decoded it itself may have finished and evicted meanwhile
+    if not KEEP_AUDIO_CACHE and os.path.exists(fout) and os.path.getsize(fout) > 0:
+        evict_audio(AUDIO_CACHE_DIR, dt)
+        return None
+    return npy_path
 
 
 if __name__ == "__main__":
@@ -196,13 +363,20 @@ if __name__ == "__main__":
     video_paths = [x for x in video_paths if "【" in x]
 
     DEBUG = 0
-    FORCE_RESET = 1
+    FORCE_RESET = 0
+    BENCHMARK = 0
+
+    if BENCHMARK:
+        benchmark_backends(video_paths[-1])
+        sys.exit(0)
 
     if FORCE_RESET:
         print('deleing existing transcripts outputs ...')
-        for folder in[RAW_DIR, CLEAN_DIR]:
+        for folder in [RAW_DIR, CLEAN_DIR, CHECKPOINT_DIR, SEGMENT_DIR]:
             if os.path.isdir(folder):
                 shutil.rmtree(folder)
+        if os.path.exists(CLEAN_MANIFEST):
+            os.remove(CLEAN_MANIFEST)
 
     os.makedirs(RAW_DIR, exist_ok=True)
     os.makedirs(CLEAN_DIR, exist_ok=True)
@@ -221,23 +395,61 @@ if __name__ == "__main__":
             if os.path.exists(fout) and os.path.getsize(fout) > 0:
                 continue
             filtered_video_paths.append(video_path)
-        video_paths = filtered_video_paths
+        # partially transcribed videos first: they only need their missing tail
+        video_paths = sorted(
+            filtered_video_paths,
+            key=lambda x: get_resume_sec(re.findall(r"【\d+】", x)[0]) == 0,
+        )
 
-    if N_WORKERS <= 1:
-        for video_path in video_paths:
-            process_video(video_path)
-    else:
-        ctx = mp.get_context("spawn")
-        with ctx.Pool(N_WORKERS, maxtasksperchild=MAX_TASKS_PER_CHILD) as pool:
-            list(
-                tqdm(
+    prefetch = None
+    pending = iter([])
+    if AUDIO_CACHE:
+        # decode audio in background threads (ffmpeg runs out of process) while the
+        # workers transcribe; the first N_WORKERS videos are decoded by the workers
+        # that pick them up, and each finished video lets one more be decoded
+        pending = iter([
+            x for x in video_paths[N_WORKERS:]
+            if not is_cached(x, AUDIO_CACHE_DIR, re.findall(r"【\d+】", x)[0])
+        ])
+        prefetch = ThreadPoolExecutor(AUDIO_EXTRACT_WORKERS)
+        prefetch_audio(prefetch, pending, AUDIO_PREFETCH_AHEAD)
+
+    try:
+        if N_WORKERS <= 1:
+            for video_path in video_paths:
+                process_video(video_path)
+                prefetch_audio(prefetch, pending)
+        elif WARM_POOL:
+            with WarmPool(N_WORKERS, process_video, warmup=get_model, max_rss_mb=MAX_WORKER_RSS_MB) as pool:
+                for _ in tqdm(
+                    pool.imap_unordered(video_paths),
+                    total=len(video_paths),
+                    desc="videos",
+                    unit="video",
+                ):
+                    prefetch_audio(prefetch, pending)
+            print(pool.format_stats())
+        else:
+            ctx = mp.get_context("spawn")
+            with ctx.Pool(N_WORKERS, maxtasksperchild=MAX_TASKS_PER_CHILD) as pool:
+                for _ in tqdm(
                     pool.imap_unordered(process_video, video_paths),
                     total=len(video_paths),
                     desc="videos",
                     unit="video",
-                )
-            )
-
-    transcript_paths = sorted(glob.glob(os.path.join(RAW_DIR, "*")))
-    for transcript_path in tqdm(transcript_paths, desc="clean", unit="file"):
-        clean_transcript_file(transcript_path)
+                ):
+                    prefetch_audio(prefetch, pending)
+    finally:
+        if prefetch is not None:
+            # a failed run should not sit decoding audio nobody will transcribe
+            prefetch.shutdown(wait=True, cancel_futures=True)
+
+    transcript_paths = sorted(glob.glob(os.path.join(RAW_DIR, "*.txt")))
+    clean_transcripts(
+        transcript_paths,
+        CLEAN_DIR,
+        CLEAN_MANIFEST,
+        n_workers=N_CLEAN_WORKERS,
+        wrap_width=CLEAN_WRAP_WIDTH,
+        verbose=VERBOSE,
+    )
@@ -0,0 +1,90 @@
+import json
+import os
+import subprocess
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def audio_cache_paths(cache_dir, dt):
+    base = os.path.join(cache_dir, dt.strip('【】'))
+    return base + '.npy', base + '.json'
+
+
+def source_key(video_path):
+    st = os.stat(video_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sample_rate': SAMPLE_RATE}
+
+
+def is_cached(video_path, cache_dir, dt):
+    npy_path, meta_path = audio_cache_paths(cache_dir, dt)
+    if not os.path.exists(npy_path) or not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as ifile:
+            meta = json.load(ifile)
+    except Exception:
+        return False
+    return {k: meta.get(k) for k in ('size', 'mtime_ns', 'sample_rate')} == source_key(video_path)
+
+
+def decode_pcm16(video_path):
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-nostdin',
+        '-i', video_path,
+        '-vn',
+        '-ac', '1',
+        '-ar', str(SAMPLE_RATE),
+        '-f', 's16le',
+        'pipe:1',
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        err = proc.stderr.decode(errors='ignore').strip()
+        raise RuntimeError(err or f'ffmpeg failed to decode audio of {video_path}')
+    return np.frombuffer(proc.stdout, dtype=np.int16)
+
+
+def extract_audio(video_path, cache_dir, dt, force=False):
+    """Decode video_path once to 16 kHz mono int16 .npy under cache_dir.
+
+    The cache is keyed by the video's size and mtime, so a re-downloaded file is
+    decoded again. Returns the .npy path.
+    """
+    npy_path, meta_path = audio_cache_paths(cache_dir, dt)
+    if not force and is_cached(video_path, cache_dir, dt):
+        return npy_path
+
+    pcm = decode_pcm16(video_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # unique per writer: a prefetch thread and a worker may decode the same
+    # video at once; np.save appends .npy to names that lack it
+    suffix = f'.{os.getpid()}_{threading.get_ident()}.tmp'
+    tmp = npy_path[:-4] + suffix + '.npy'
+    np.save(tmp, pcm)
+    os.replace(tmp, npy_path)
+
+    meta = source_key(video_path)
+    meta['duration'] = len(pcm) / SAMPLE_RATE
+    with open(meta_path + suffix, 'w', encoding='utf-8') as ofile:
+        json.dump(meta, ofile)
+    os.replace(meta_path + suffix, meta_path)
+    return npy_path
+
+
+def evict_audio(cache_dir, dt):
+    for path in audio_cache_paths(cache_dir, dt):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_audio(npy_path, start_sec=0.0, end_sec=None):
+    """float32 waveform in [-1, 1] as faster-whisper expects, read via mmap."""
+    pcm = np.load(npy_path, mmap_mode='r')
+    start = int(start_sec * SAMPLE_RATE)
+    end = None if end_sec is None else int(end_sec * SAMPLE_RATE)
+    return pcm[start:end].astype(np.float32) / 32768.0
@@ -0,0 +1,218 @@
+"""Local stand-in for the OpenAI-compatible Files + Batches endpoints.
+
+Runs batches synchronously with a canned reply so the offline path of
+OPENAI_API.run_batch_offline can be exercised without a provider account:
+
+    python -m src.llm.batch_standin_server --port 8765 --reply '{"signals": []}'
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ...
+
+src/llm/check_batch_offline.py runs submit / collect / resume against it.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email import message_from_bytes
+from email.policy import default as default_policy
+import argparse
+import itertools
+import json
+import threading
+import time
+
+REPLY = "{}"
+# polls answered with in_progress before a batch reports its final status
+POLLS_BEFORE_DONE = 1
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+files = {}
+batches = {}
+
+
+def new_id(prefix):
+    with _lock:
+        return f"{prefix}_{next(_ids)}"
+
+
+def fake_usage(body):
+    prompt_tokens = len(json.dumps(body, ensure_ascii=False))
+    completion_tokens = len(REPLY)
+    return prompt_tokens, completion_tokens
+
+
+def fake_chat_completion(body):
+    prompt_tokens, completion_tokens = fake_usage(body)
+    return {
+        "id": new_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "standin"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": REPLY},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def fake_response(body):
+    prompt_tokens, completion_tokens = fake_usage(body)
+    return {
+        "id": new_id("resp"),
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "standin"),
+        "status": "completed",
+        "error": None,
+        "incomplete_details": None,
+        "instructions": None,
+        "metadata": {},
+        "output": [{
+            "type": "message",
+            "id": new_id("msg"),
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": REPLY, "annotations": []}],
+        }],
+        "parallel_tool_calls": False,
+        "temperature": body.get("temperature"),
+        "tool_choice": "auto",
+        "tools": [],
+        "top_p": 1.0,
+        "usage": {
+            "input_tokens": prompt_tokens,
+            "input_tokens_details": {"cached_tokens": 0, "cache_write_tokens": 0},
+            "output_tokens": completion_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def run_batch(batch):
+    lines = files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+    out = []
+    for line in lines:
+        if not line.strip():
+            continue
+        req = json.loads(line)
+        if req["url"].endswith("/chat/completions"):
+            body = fake_chat_completion(req["body"])
+        else:
+            body = fake_response(req["body"])
+        out.append(json.dumps({
+            "id": new_id("batch_req"),
+            "custom_id": req["custom_id"],
+            "response": {"status_code": 200, "request_id": new_id("req"), "body": body},
+            "error": None,
+        }, ensure_ascii=False))
+
+    output_file_id = new_id("file")
+    files[output_file_id] = {"content": ("\n".join(out) + "\n").encode("utf-8"), "filename": "output.jsonl"}
+    batch["output_file_id"] = output_file_id
+    batch["request_counts"] = {"total": len(out), "completed": len(out), "failed": 0}
+
+
+def batch_object(batch):
+    keys = ("id", "object", "endpoint", "input_file_id", "completion_window", "status",
+            "created_at", "output_file_id", "error_file_id", "request_counts", "metadata")
+    return {k: batch.get(k) for k in keys}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.path.endswith("/files"):
+            msg = message_from_bytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body,
+                policy=default_policy,
+            )
+            upload = next(x for x in msg.iter_parts() if x.get_param("name", header="content-disposition") == "file")
+            file_id = new_id("file")
+            content = upload.get_payload(decode=True)
+            files[file_id] = {"content": content, "filename": upload.get_filename()}
+            return self.send_json({
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": upload.get_filename(),
+                "purpose": "batch",
+                "status": "processed",
+            })
+
+        if self.path.endswith("/batches"):
+            req = json.loads(body)
+            batch = {
+                "id": new_id("batch"),
+                "object": "batch",
+                "endpoint": req["endpoint"],
+                "input_file_id": req["input_file_id"],
+                "completion_window": req.get("completion_window", "24h"),
+                "status": "validating",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                "metadata": req.get("metadata"),
+                "polls": 0,
+            }
+            run_batch(batch)
+            batches[batch["id"]] = batch
+            return self.send_json(batch_object(batch))
+
+        self.send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+    def do_GET(self):
+        parts = self.path.rstrip("/").split("/")
+        if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in batches:
+            batch = batches[parts[-1]]
+            batch["polls"] += 1
+            batch["status"] = "completed" if batch["polls"] > POLLS_BEFORE_DONE else "in_progress"
+            return self.send_json(batch_object(batch))
+
+        if parts[-1] == "content" and parts[-2] in files:
+            data = files[parts[-2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+
+def serve(host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--reply", default=REPLY, help="content every request answers with")
+    args = parser.parse_args()
+    REPLY = args.reply
+    print(f"batch stand-in on http://{args.host}:{args.port}/v1")
+    ThreadingHTTPServer((args.host, args.port), Handler).serve_forever()
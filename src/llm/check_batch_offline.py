@@ -0,0 +1,100 @@
+"""End-to-end check of OPENAI_API's offline batch mode against the local stand-in.
+
+Submits a few items, kills a collection part way through, and checks that
+rerunning collect_batch writes only the items the killed run had not, and
+that a third run writes nothing. Runs in a temp dir, so the repo's outputs,
+usage.db and llm_cache.db are untouched:
+
+    python -m src.llm.check_batch_offline
+"""
+import os
+import tempfile
+
+from pydantic import BaseModel
+
+from src.llm import batch_standin_server
+from src.llm.mq_iterclass import BatchItem
+
+PORT = 8766
+N_ITEMS = 5
+# collect_batch is interrupted while writing this (1-based) result
+KILL_AT = 3
+
+
+class Signals(BaseModel):
+    signals: list[str] = []
+
+
+class Killed(Exception):
+    pass
+
+
+def check():
+    # set before OpenAI() reads them
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "standin")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "standin")
+    from src.llm.openai_api import OPENAI_API, OPENAI_API_DEEPSEEK
+
+    batch_standin_server.REPLY = '{"signals": ["standin"]}'
+    server = batch_standin_server.serve(port=PORT)
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="batch_offline_"))
+    try:
+        try:
+            OPENAI_API_DEEPSEEK(Signals, "check", "schema").submit_batch([BatchItem(id="x", text="x")])
+            raise AssertionError("DeepSeek batch submit was not refused")
+        except ValueError:
+            pass
+
+        app = OPENAI_API(Signals, "check", "Extract signals.", model="gpt-5-nano", use_cache=False)
+        items = [BatchItem(id=f"d{i}", text=f"transcript {i}") for i in range(N_ITEMS)]
+        state = app.submit_batch(items)
+        batch_id = state["batch_id"]
+        assert app.list_open_batches() == [batch_id]
+
+        written = []
+        write_output = app.write_output
+
+        def record(item, js, summary):
+            if len(written) + 1 == KILL_AT:
+                raise Killed()
+            write_output(item, js, summary)
+            written.append(item.id)
+
+        app.write_output = record
+        try:
+            app.collect_batch(batch_id, poll_interval=0.01)
+            raise AssertionError("collect_batch was not interrupted")
+        except Killed:
+            pass
+        first = list(written)
+        assert len(first) == KILL_AT - 1, first
+        assert app.list_open_batches() == [batch_id]
+
+        # resume: only the results the killed run did not write
+        written.clear()
+        app.write_output = lambda item, js, summary: (write_output(item, js, summary), written.append(item.id))
+        ret = app.collect_batch(batch_id, poll_interval=0.01)
+        assert ret["ok"] == N_ITEMS and not ret["errors"], ret
+        assert sorted(first + written) == sorted(x.id for x in items), (first, written)
+        assert not set(first) & set(written), (first, written)
+        assert app.list_open_batches() == []
+        assert sorted(app.load_batch_state(batch_id)["collected"]) == sorted(x.id for x in items)
+
+        # collecting a finished batch again writes nothing
+        written.clear()
+        ret = app.collect_batch(batch_id, poll_interval=0.01)
+        assert ret["ok"] == N_ITEMS and written == [], (ret, written)
+
+        for item in items:
+            with open(os.path.join(app.OUTPUT_FOLDER, f"{item.id}.json"), "r", encoding="utf-8") as ifile:
+                assert Signals.model_validate_json(ifile.read()).signals == ["standin"]
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+    print(f"offline batch ok: {N_ITEMS} items, killed at {KILL_AT}, resumed without rewrites")
+
+
+if __name__ == "__main__":
+    check()
@@ -1,8 +1,12 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
+from openai.lib._pydantic import to_strict_json_schema
+from openai.types.responses import Response
 from openai.types.responses.response_reasoning_item import ResponseReasoningItem
 
-from src.llm.openai_usage_tracker import TOKEN_CAP, UsageTracker
+from src.llm.openai_response_cache import ResponseCache, make_cache_key
+from src.llm.openai_usage_tracker import TOKEN_CAP, TokenBudget, UsageTracker, count_tokens
 from src.llm.openai_schema_tracker import FolderSchemaTracker
+from src.llm.rate_limiter import MAX_RETRIES, AdaptiveLimiter, call_with_retry
 from src.transcript.normalize_transcript import NormFinder
 from src.llm.mq_iterclass import BatchItem
 
@@ -10,6 +14,7 @@ from dotenv import load_dotenv
 from pydantic import BaseModel
 from tqdm import tqdm
 
+import glob
 import re
 import os
 import json
@@ -19,10 +24,25 @@ from typing_extensions import override
 from typing import Iterable, Iterator, Optional, Sequence, Tuple, Union
 import time
 import asyncio
+import httpx
 import nest_asyncio
 load_dotenv() 
 SEED  = 12345
 
+# pooled HTTP client for the async path; one per run_batch_multiprocess call
+HTTP_MAX_CONNECTIONS = 200
+HTTP_MAX_KEEPALIVE = 100
+HTTP_KEEPALIVE_EXPIRY = 60
+HTTP_TIMEOUT = 300
+HTTP_CONNECT_TIMEOUT = 10
+DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+
+# offline batch mode: request/response JSONL and batch state per output folder
+BATCH_DIR = 'outputs/batch'
+BATCH_COMPLETION_WINDOW = '24h'
+BATCH_POLL_INTERVAL = 60
+BATCH_TERMINAL = {'completed', 'failed', 'expired', 'cancelled'}
+
 nf = NormFinder('')
 
 
@@ -47,23 +67,46 @@ def iter_batch_items(inputs: BatchInputs) -> Iterator[BatchItem]:
 
 
 
+def make_async_http_client(
+    max_connections: int = HTTP_MAX_CONNECTIONS,
+    max_keepalive: int = HTTP_MAX_KEEPALIVE,
+    keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+):
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_keepalive, max_connections),
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
 def _format_blocks(blocks: Sequence[Tuple[str, str]]) -> str:
     return "\n".join([f"{label}:\n<<<\n{value}\n>>>" for (label, value) in blocks])
 
 
 class OPENAI_API:
+    # key into rate_limiter.PROVIDER_LIMITS
+    PROVIDER = 'openai'
+    # None for providers without an OpenAI-compatible Batch API
+    BATCH_ENDPOINT = '/v1/responses'
+
     def __init__(self, pydantic_template: BaseModel, 
                  output_folder:str, 
                  schema: str, 
                  model:str= 'openai',
                  temperature:float=1.0,
-                 default_block_label: str = "Transcript"):
+                 default_block_label: str = "Transcript",
+                 use_cache: bool = True):
         """Initialize the extractor.
 
         Args:
             pydantic_template: Pydantic model class or instance used as the output template.
             output_folder: Folder path to write extracted results.
             schema: Prompt/schema instructions passed to the model.
+            use_cache: Reuse the stored output of an identical earlier request instead of calling the API.
+                Only applies at temperature 0 (or None); repeats of a sampled request are meant to differ.
         """
         self.schema = schema
         self.model = model
@@ -75,11 +118,20 @@ class OPENAI_API:
         os.makedirs(self.OUTPUT_FOLDER, exist_ok=True)
         os.makedirs(self.DEBUG_PATH, exist_ok=True)
         FolderSchemaTracker().set(folder=output_folder, model=self.model, schema=self.schema)
-        self.client = OpenAI()
-
-    def request(self, *, blocks: Sequence[Tuple[str, str]]):
+        # retries are done by call_with_retry / AdaptiveLimiter, which see the
+        # 429s; the SDK's own retries would hide them and multiply attempts
+        self.client = OpenAI(max_retries=0)
+        # set only while run_batch_multiprocess runs; bound to that event loop
+        self.aclient = None
+        self.limiter = None
+        self.cache = ResponseCache() if use_cache and not temperature else None
+
+    def make_async_client(self, http_client) -> AsyncOpenAI:
+        return AsyncOpenAI(http_client=http_client, max_retries=0)
+
+    def request_kwargs(self, blocks: Sequence[Tuple[str, str]]) -> dict:
         user_text = _format_blocks(blocks)
-        resp = self.client.responses.parse(
+        return dict(
             model="gpt-5-nano",
             input=[
                 {"role": "developer", "content": [{"type": "input_text", "text": self.schema}]},
@@ -95,7 +147,47 @@ class OPENAI_API:
             timeout=300,
             # max_output_tokens=1000
         )
-        return resp
+
+    def request(self, *, blocks: Sequence[Tuple[str, str]]):
+        return self.client.responses.parse(**self.request_kwargs(blocks))
+
+    async def arequest(self, *, blocks: Sequence[Tuple[str, str]]):
+        return await self.aclient.responses.parse(**self.request_kwargs(blocks))
+
+    def item_blocks(self, transcript, helper=None):
+        if helper is None:
+            return [(self.default_block_label, transcript)]
+        return [("Transcript", transcript), ("Helper", helper)]
+
+    def cache_key(self, blocks: Sequence[Tuple[str, str]]) -> str:
+        """Hash of the request actually sent, so any parameter change is a miss."""
+        kwargs = self.request_kwargs(blocks)
+        kwargs.pop("timeout", None)
+        if "text_format" in kwargs:
+            kwargs["text_format"] = kwargs["text_format"].model_json_schema()
+        return make_cache_key({"provider": type(self).__name__, "request": kwargs})
+
+    def estimate_input_tokens(self, item: BatchItem) -> int:
+        blocks = self.item_blocks(nf.normalize_zh_transcript(item.text), item.helper)
+        return count_tokens(self.schema) + count_tokens(_format_blocks(blocks))
+
+    def lookup_cache(self, blocks, ustrack: UsageTracker):
+        """Return (key, cached output or None); key is None when caching is off."""
+        if self.cache is None:
+            return None, None
+        key = self.cache_key(blocks)
+        cached = self.cache.get(key)
+        ustrack.update_cache_stats(self.OUTPUT_FOLDER, cached is not None)
+        return key, cached
+
+    def write_output(self, item: BatchItem, js, summary):
+        out_path = os.path.join(self.OUTPUT_FOLDER, f"{item.id}.json")
+        debug_path = os.path.join(self.DEBUG_PATH, f"d{item.id}.txt")
+        with open(out_path, "w", encoding="utf-8") as ofile:
+            ofile.write(js)
+
+        with open(debug_path, 'w') as ofile:
+            ofile.writelines(summary)
 
     def get_json(self, text, block_label: Optional[str] = None):
         label = block_label or self.default_block_label
@@ -104,6 +196,13 @@ class OPENAI_API:
     def get_json2(self, transcript, helper):
         return self.request(blocks=[("Transcript", transcript), ("Helper", helper)])
 
+    async def aget_json(self, text, block_label: Optional[str] = None):
+        label = block_label or self.default_block_label
+        return await self.arequest(blocks=[(label, text)])
+
+    async def aget_json2(self, transcript, helper):
+        return await self.arequest(blocks=[("Transcript", transcript), ("Helper", helper)])
+
     def extract_output(self, resp):        
         js = resp.output_parsed.model_dump_json(indent=2)
         summary = ""
@@ -141,17 +240,19 @@ class OPENAI_API:
                 break
             
             out_path = os.path.join(self.OUTPUT_FOLDER, f"{item.id}.json")
-            debug_path = os.path.join(self.DEBUG_PATH, f"d{item.id}.txt")
             if not force and os.path.exists(out_path):
                 continue
 
             transcript2 = nf.normalize_zh_transcript(item.text)
+            blocks = self.item_blocks(transcript2, item.helper)
+            key, cached = self.lookup_cache(blocks, ustrack)
+            if cached is not None:
+                self.write_output(item, cached["output"], cached["summary"])
+                pbar.set_postfix({"spent": spent, "status": "cached"})
+                continue
             
             now = time.time()
-            if item.helper is None:
-                resp = self.get_json(transcript2)
-            else:
-                resp = self.get_json2(transcript2, item.helper)
+            resp = call_with_retry(lambda: self.request(blocks=blocks))
 
             try:
                 js, summary, used = self.extract_output(resp)
@@ -160,11 +261,9 @@ class OPENAI_API:
                 yield resp
                 raise
 
-            with open(out_path, "w", encoding="utf-8") as ofile:
-                ofile.write(js)
-                
-            with open(debug_path, 'w') as ofile:   
-                ofile.writelines(summary)
+            self.write_output(item, js, summary)
+            if key is not None:
+                self.cache.set(key, self.model, js, summary, used)
 
             spent = ustrack.set(used)
 
@@ -194,20 +293,29 @@ class OPENAI_API:
         usage_lock: asyncio.Lock,
         force: bool,
         semaphore: asyncio.Semaphore,
+        token_estimate: int = 0,
     ):
         async with semaphore:
             out_path = os.path.join(self.OUTPUT_FOLDER, f"{item.id}.json")
-            debug_path = os.path.join(self.DEBUG_PATH, f"d{item.id}.txt")
             if not force and os.path.exists(out_path):
                 return {"dt": item.id, "skipped": True, "used": 0}
 
             transcript2 = nf.normalize_zh_transcript(item.text)
+            blocks = self.item_blocks(transcript2, item.helper)
+            key, cached = self.lookup_cache(blocks, ustrack)
+            if cached is not None:
+                self.write_output(item, cached["output"], cached["summary"])
+                return {"dt": item.id, "skipped": False, "cached": True, "used": 0}
 
             now = time.time()
-            if item.helper is None:
-                resp = await asyncio.to_thread(self.get_json, transcript2)
+            if self.aclient is not None:
+                call = lambda: self.arequest(blocks=blocks)
             else:
-                resp = await asyncio.to_thread(self.get_json2, transcript2, item.helper)
+                call = lambda: asyncio.to_thread(self.request, blocks=blocks)
+            if self.limiter is not None:
+                resp = await self.limiter.call(call, tokens=token_estimate)
+            else:
+                resp = await call()
 
             try:
                 js, summary, used = self.extract_output(resp)
@@ -215,11 +323,9 @@ class OPENAI_API:
                 print('error formatting? %s' % item.id)
                 raise exc
 
-            with open(out_path, "w", encoding="utf-8") as ofile:
-                ofile.write(js)
-
-            with open(debug_path, 'w') as ofile:
-                ofile.writelines(summary)
+            self.write_output(item, js, summary)
+            if key is not None:
+                self.cache.set(key, self.model, js, summary, used)
 
             async with usage_lock:
                 spent = ustrack.set(used)
@@ -270,59 +376,146 @@ class OPENAI_API:
         max_workers: int = 20,
         raise_on_error: bool = True,
         show_progress: bool = True,
+        use_async_client: bool = True,
+        max_connections: Optional[int] = None,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        token_cap: int = TOKEN_CAP,
+        output_token_estimate: Optional[int] = None,
+        adaptive_rate: bool = True,
+        max_retries: int = MAX_RETRIES,
     ):
+        """Run items concurrently, at most max_workers requests in flight.
+
+        Each item reserves its estimated cost (prompt tokens plus
+        output_token_estimate, by default the folder's observed average from
+        usage.db) before it is started; no new item starts once the
+        reservations would push the day's spend past token_cap.
+
+        With use_async_client the requests go through AsyncOpenAI on one pooled
+        keep-alive HTTP client (max_connections defaults to max_workers), so no
+        OS thread is held per call; otherwise each call runs in asyncio.to_thread
+        on the sync client.
+
+        With adaptive_rate every call goes through an AdaptiveLimiter for
+        self.PROVIDER (RPM/TPM buckets, AIMD concurrency up to max_workers,
+        jittered backoff, max_retries per item); its counters are written to
+        usage.db (llm_rate_stats) when the run ends.
+        """
         async def _runner():
-            ustrack = UsageTracker(model=self.model, cap=TOKEN_CAP)
+            http_client = None
+            if use_async_client:
+                http_client = make_async_http_client(
+                    max_connections=max_connections or max_workers,
+                    max_keepalive=max_keepalive,
+                )
+                self.aclient = self.make_async_client(http_client)
+            if adaptive_rate:
+                self.limiter = AdaptiveLimiter.for_provider(
+                    self.PROVIDER,
+                    max_concurrency=max_workers,
+                    max_retries=max_retries,
+                )
+            try:
+                return await _run_items()
+            finally:
+                self.aclient = None
+                if http_client is not None:
+                    await http_client.aclose()
+                if self.limiter is not None:
+                    if self.limiter.stats["requests"]:
+                        UsageTracker(model=self.model).update_rate_stats(self.OUTPUT_FOLDER, self.limiter.snapshot())
+                    self.limiter = None
+
+        async def _run_items():
+            ustrack = UsageTracker(model=self.model, cap=token_cap)
+
+            pending = []
+            for item in iter_batch_items(inputs):
+                out_path = os.path.join(self.OUTPUT_FOLDER, f"{item.id}.json")
+                if not force and os.path.exists(out_path):
+                    continue
+                pending.append(item)
+            if not pending:
+                return
 
-            items = iter_batch_items(inputs)
+            # admit a task only if its estimated cost fits under the cap next to
+            # everything already in flight
+            budget = TokenBudget(token_cap, ustrack.get()['spent'])
+            output_estimate = output_token_estimate or ustrack.estimate_output_tokens(self.OUTPUT_FOLDER)
 
             semaphore = asyncio.Semaphore(max_workers)
             usage_lock = asyncio.Lock()
 
-            tasks = []
-            for item in items:
-                out_path = os.path.join(self.OUTPUT_FOLDER, f"{item.id}.json")
-                if not force and os.path.exists(out_path):
-                    continue
-                tasks.append(
-                    asyncio.create_task(
-                        self._process_one_item_async(
-                            item=item,
-                            ustrack=ustrack,
-                            usage_lock=usage_lock,
-                            force=force,
-                            semaphore=semaphore,
-                        )
-                    )
-                )
-
+            inflight = {}
             results = []
             errors = []
-            if not tasks:
-                return
-            pbar = tqdm(tasks, desc="Extracting", unit="doc") if show_progress else None
-            for task in asyncio.as_completed(tasks):
-                try:
-                    result = await task
-                    results.append(result)
-                    if pbar is not None:
-                        pbar.update(1)
-                        pbar.set_postfix({
-                            "used": result.get("used", 0),
-                            "spent": result.get("spent", 0),
-                            "status": "skipped" if result.get("skipped") else "ok",
-                        })
-                except Exception as exc:
-                    errors.append(exc)
-                    if pbar is not None:
-                        pbar.update(1)
-                        pbar.set_postfix({"status": "error"})
-                    if raise_on_error:
+            queue = iter(pending)
+            next_item = None
+            cap_reached = False
+            pbar = tqdm(total=len(pending), desc="Extracting", unit="doc") if show_progress else None
+            try:
+                while True:
+                    while not cap_reached and len(inflight) < max_workers:
+                        if next_item is None:
+                            next_item = next(queue, None)
+                        if next_item is None:
+                            break
+                        estimate = self.estimate_input_tokens(next_item) + output_estimate
+                        if not budget.reserve(estimate):
+                            # retry once in-flight calls settle; give up if nothing is running
+                            cap_reached = not inflight
+                            break
+                        task = asyncio.create_task(
+                            self._process_one_item_async(
+                                item=next_item,
+                                ustrack=ustrack,
+                                usage_lock=usage_lock,
+                                force=force,
+                                semaphore=semaphore,
+                                token_estimate=estimate,
+                            )
+                        )
+                        inflight[task] = estimate
+                        next_item = None
+
+                    if not inflight:
+                        break
+
+                    done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        estimate = inflight.pop(task)
+                        try:
+                            result = task.result()
+                        except Exception as exc:
+                            budget.release(estimate)
+                            errors.append(exc)
+                            if pbar is not None:
+                                pbar.update(1)
+                                pbar.set_postfix({"status": "error"})
+                            if raise_on_error:
+                                raise
+                            continue
+
+                        budget.release(estimate, result.get("spent"))
+                        results.append(result)
                         if pbar is not None:
-                            pbar.close()
-                        raise
-            if pbar is not None:
-                pbar.close()
+                            pbar.update(1)
+                            pbar.set_postfix({
+                                "used": result.get("used", 0),
+                                "spent": budget.spent,
+                                "reserved": budget.reserved,
+                                "status": "skipped" if result.get("skipped") else "cached" if result.get("cached") else "ok",
+                            })
+            finally:
+                # don't leave requests running on a client about to close
+                for task in inflight:
+                    task.cancel()
+                if pbar is not None:
+                    pbar.close()
+
+            if cap_reached:
+                not_started = len(pending) - len(results) - len(errors)
+                print('token cap %s reached (spent %s): %s items not started' % (token_cap, budget.spent, not_started))
 
             if errors and raise_on_error:
                 raise errors[0]
@@ -342,6 +535,249 @@ class OPENAI_API:
 
 
 
+    def batch_body(self, blocks: Sequence[Tuple[str, str]]) -> dict:
+        """request_kwargs as a JSON request body for the batch endpoint."""
+        body = self.request_kwargs(blocks)
+        body.pop('timeout', None)
+        template = body.pop('text_format')
+        body['text'] = {
+            **body['text'],
+            'format': {
+                'type': 'json_schema',
+                'name': template.__name__,
+                'schema': to_strict_json_schema(template),
+                'strict': True,
+            },
+        }
+        return body
+
+    def parse_batch_body(self, body: dict):
+        """(resp, js, summary, used) from one batch result body, as extract_output gives."""
+        resp = Response.model_validate(body)
+        js = self.template.model_validate_json(resp.output_text).model_dump_json(indent=2)
+        summary = ""
+        if resp.output and isinstance(resp.output[0], ResponseReasoningItem):
+            summary = [ln.text.replace('. ', '.\n') for ln in resp.output[0].summary]
+        return resp, js, summary, resp.usage.total_tokens
+
+    def get_batch_dir(self) -> str:
+        return os.path.join(BATCH_DIR, os.path.basename(self.OUTPUT_FOLDER))
+
+    def submit_batch(
+        self,
+        inputs: BatchInputs,
+        force: bool = False,
+        token_cap: int = TOKEN_CAP,
+        output_token_estimate: Optional[int] = None,
+    ):
+        """Serialise pending items into one JSONL batch and submit it.
+
+        Cache hits are written straight away and items beyond token_cap are
+        left out. Returns the saved batch state, or None if nothing was sent.
+        """
+        if self.BATCH_ENDPOINT is None:
+            raise ValueError(f"{self.PROVIDER} has no batch API; use run_batch_multiprocess instead")
+        ustrack = UsageTracker(model=self.model, cap=token_cap)
+        budget = TokenBudget(token_cap, ustrack.get()['spent'])
+        output_estimate = output_token_estimate or ustrack.estimate_output_tokens(self.OUTPUT_FOLDER)
+        schema_tokens = count_tokens(self.schema)
+
+        batch_dir = self.get_batch_dir()
+        os.makedirs(batch_dir, exist_ok=True)
+        input_path = os.path.join(batch_dir, '%s.jsonl' % time.strftime('%Y%m%d_%H%M%S'))
+
+        keys = {}
+        n_cached = 0
+        n_over_cap = 0
+        with open(input_path, 'w', encoding='utf-8') as ofile:
+            for item in iter_batch_items(inputs):
+                out_path = os.path.join(self.OUTPUT_FOLDER, f"{item.id}.json")
+                if not force and os.path.exists(out_path):
+                    continue
+
+                transcript2 = nf.normalize_zh_transcript(item.text)
+                blocks = self.item_blocks(transcript2, item.helper)
+                key, cached = self.lookup_cache(blocks, ustrack)
+                if cached is not None:
+                    self.write_output(item, cached["output"], cached["summary"])
+                    n_cached += 1
+                    continue
+
+                estimate = schema_tokens + count_tokens(_format_blocks(blocks)) + output_estimate
+                if not budget.reserve(estimate):
+                    n_over_cap += 1
+                    continue
+
+                keys[str(item.id)] = key
+                ofile.write(json.dumps({
+                    'custom_id': str(item.id),
+                    'method': 'POST',
+                    'url': self.BATCH_ENDPOINT,
+                    'body': self.batch_body(blocks),
+                }, ensure_ascii=False) + '\n')
+
+        print('batch %s: %s requests, %s cached, %s over token cap %s' % (
+            self.OUTPUT_FOLDER, len(keys), n_cached, n_over_cap, token_cap))
+        if not keys:
+            os.remove(input_path)
+            return None
+
+        def upload():
+            with open(input_path, 'rb') as ifile:
+                return self.client.files.create(file=ifile, purpose='batch')
+
+        uploaded = call_with_retry(upload)
+        batch = call_with_retry(lambda: self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=self.BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+            metadata={'folder': self.OUTPUT_FOLDER},
+        ))
+
+        state = {
+            'batch_id': batch.id,
+            'input_path': input_path,
+            'submitted_at': time.time(),
+            'status': batch.status,
+            'keys': keys,
+        }
+        self._save_batch_state(state)
+        return state
+
+    def _save_batch_state(self, state: dict):
+        path = os.path.join(self.get_batch_dir(), '%s.json' % state['batch_id'])
+        with open(path + '.tmp', 'w', encoding='utf-8') as ofile:
+            json.dump(state, ofile, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def load_batch_state(self, batch_id: str) -> dict:
+        with open(os.path.join(self.get_batch_dir(), '%s.json' % batch_id), 'r', encoding='utf-8') as ifile:
+            return json.load(ifile)
+
+    def list_open_batches(self):
+        """Batch ids submitted from this folder whose results were never collected."""
+        ret = []
+        for path in sorted(glob.glob(os.path.join(self.get_batch_dir(), '*.json'))):
+            with open(path, 'r', encoding='utf-8') as ifile:
+                state = json.load(ifile)
+            if 'collected_at' not in state:
+                ret.append(state['batch_id'])
+        return ret
+
+    def get_collected_path(self, batch_id: str) -> str:
+        return os.path.join(self.get_batch_dir(), '%s.collected.jsonl' % batch_id)
+
+    def load_collected(self, batch_id: str, state: dict) -> set:
+        """custom_ids already written by an earlier (possibly killed) collect_batch."""
+        collected = set(state.get('collected', []))
+        path = self.get_collected_path(batch_id)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as ifile:
+                for ln in ifile:
+                    try:
+                        collected.add(json.loads(ln))
+                    except json.JSONDecodeError:
+                        # torn last line from a killed run
+                        break
+        return collected
+
+    def collect_batch(self, batch_id: str, wait: bool = True, poll_interval: float = BATCH_POLL_INTERVAL):
+        """Poll a submitted batch and fan its results out like the online path.
+
+        Each result is written to OUTPUT_FOLDER / DEBUG_PATH, stored in the
+        response cache and recorded in UsageTracker; time_spent is the batch
+        wall time split evenly over its results. With wait=False returns the
+        current status if the batch is still running.
+
+        Collected custom_ids are logged as they are written, so rerunning after
+        a crash skips them instead of recording their usage twice.
+        """
+        state = self.load_batch_state(batch_id)
+        collected = self.load_collected(batch_id, state)
+        ustrack = UsageTracker(model=self.model)
+
+        while True:
+            batch = call_with_retry(lambda: self.client.batches.retrieve(batch_id))
+            if batch.status in BATCH_TERMINAL or not wait:
+                break
+            time.sleep(poll_interval)
+
+        ret = {'batch_id': batch_id, 'status': batch.status, 'ok': 0, 'errors': []}
+        if batch.status not in BATCH_TERMINAL:
+            return ret
+
+        rows = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = call_with_retry(lambda: self.client.files.content(file_id).text)
+                rows.extend(json.loads(ln) for ln in text.splitlines() if ln.strip())
+
+        time_spent = (time.time() - state['submitted_at']) / max(len(rows), 1)
+        collected_path = self.get_collected_path(batch_id)
+        with open(collected_path, 'w', encoding='utf-8') as log:
+            # rewritten from what was read back, dropping a torn last line
+            log.writelines(json.dumps(x) + '\n' for x in sorted(collected))
+            for row in rows:
+                item_id = row['custom_id']
+                if item_id in collected:
+                    ret['ok'] += 1
+                    continue
+                response = row.get('response') or {}
+                if row.get('error') or response.get('status_code') != 200:
+                    ret['errors'].append((item_id, row.get('error') or response.get('body')))
+                    continue
+                try:
+                    resp, js, summary, used = self.parse_batch_body(response['body'])
+                except Exception as exc:
+                    print('error formatting? %s' % item_id)
+                    ret['errors'].append((item_id, repr(exc)))
+                    continue
+
+                self.write_output(BatchItem(id=item_id, text=''), js, summary)
+                key = state['keys'].get(item_id)
+                if key is not None and self.cache is not None:
+                    self.cache.set(key, self.model, js, summary, used)
+                ustrack.set(used)
+                ustrack.update_db(self.normalize_usage(resp, '%s/%s' % (self.OUTPUT_FOLDER, item_id), time_spent))
+                log.write(json.dumps(item_id) + '\n')
+                log.flush()
+                collected.add(item_id)
+                ret['ok'] += 1
+
+        state['status'] = batch.status
+        state['collected'] = sorted(collected)
+        state['collected_at'] = time.time()
+        state['ok'] = ret['ok']
+        state['errors'] = len(ret['errors'])
+        self._save_batch_state(state)
+        # folded into the state file now
+        os.remove(collected_path)
+        return ret
+
+    def run_batch_offline(
+        self,
+        inputs: BatchInputs,
+        force: bool = False,
+        token_cap: int = TOKEN_CAP,
+        output_token_estimate: Optional[int] = None,
+        poll_interval: float = BATCH_POLL_INTERVAL,
+    ):
+        """Bulk mode: submit everything pending as one provider batch, wait, collect.
+
+        Trades latency (up to BATCH_COMPLETION_WINDOW) for the batch discount
+        and no client-side concurrency. A run killed while waiting can be
+        resumed with collect_batch(batch_id) / list_open_batches().
+        """
+        state = self.submit_batch(
+            inputs,
+            force=force,
+            token_cap=token_cap,
+            output_token_estimate=output_token_estimate,
+        )
+        if state is None:
+            return None
+        return self.collect_batch(state['batch_id'], wait=True, poll_interval=poll_interval)
+
     def run_batch_with_helper(self, inputs: BatchInputs, token_cap=TOKEN_CAP, force=False):
         """Get support from topic?
 
@@ -354,11 +790,16 @@ class OPENAI_API:
 
 
 class OPENAI_API_DEEPSEEK(OPENAI_API):
+    PROVIDER = 'deepseek'
+    # DeepSeek has no Files/Batches API; bulk runs go through run_batch_multiprocess
+    BATCH_ENDPOINT = None
+
     def __init__(self, pydantic_template: BaseModel, 
                  output_folder:str, 
                  schema: str, model: str="deepseek-reasoner", 
                  temperature: float=1.0,
-                 default_block_label="Transcript"):
+                 default_block_label="Transcript",
+                 use_cache: bool = True):
         super().__init__(
             pydantic_template=pydantic_template,
             output_folder=output_folder,
@@ -366,6 +807,7 @@ class OPENAI_API_DEEPSEEK(OPENAI_API):
             model=model,
             temperature=temperature,
             default_block_label=default_block_label,
+            use_cache=use_cache,
         )
         self.schema = f"""
 {schema}
@@ -378,15 +820,21 @@ class OPENAI_API_DEEPSEEK(OPENAI_API):
 {json.dumps(self.template.model_json_schema(), indent=2, ensure_ascii=False)}
         """
         FolderSchemaTracker().set(folder=output_folder, model=self.model, schema=self.schema)
-        self.client = OpenAI(api_key=os.getenv('DEEPSEEK_API_KEY'), base_url='https://api.deepseek.com')
+        self.client = OpenAI(api_key=os.getenv('DEEPSEEK_API_KEY'), base_url=DEEPSEEK_BASE_URL, max_retries=0)
         self._JSON_FENCE_RE = re.compile(
             r"```(?:json)?\s*([\s\S]*?)\s*```",
             re.IGNORECASE
         )
 
-    def request(self, *, blocks: Sequence[Tuple[str, str]]):
+    @override
+    def make_async_client(self, http_client) -> AsyncOpenAI:
+        return AsyncOpenAI(api_key=os.getenv('DEEPSEEK_API_KEY'), base_url=DEEPSEEK_BASE_URL,
+                           http_client=http_client, max_retries=0)
+
+    @override
+    def request_kwargs(self, blocks: Sequence[Tuple[str, str]]) -> dict:
         user_text = _format_blocks(blocks)
-        resp = self.client.chat.completions.create(
+        return dict(
             model=self.model,
             messages=[
                 {"role": "system", "content": self.schema},
@@ -394,7 +842,14 @@ class OPENAI_API_DEEPSEEK(OPENAI_API):
             ],
             temperature=self.temperature,
         )
-        return resp
+
+    @override
+    def request(self, *, blocks: Sequence[Tuple[str, str]]):
+        return self.client.chat.completions.create(**self.request_kwargs(blocks))
+
+    @override
+    async def arequest(self, *, blocks: Sequence[Tuple[str, str]]):
+        return await self.aclient.chat.completions.create(**self.request_kwargs(blocks))
     
     @override
     def get_json2(self, transcript, helper):
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import sqlite3
+from typing import Any, Dict, Optional
+
+
+CACHE_DB_PATH = "llm_cache.db"
+
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Parsed LLM outputs keyed by a hash of everything that went into the request.
+
+    Kept out of usage.db since it stores full outputs; hit/miss counts go to
+    UsageTracker.update_cache_stats.
+    """
+
+    def __init__(self, db_path: str = CACHE_DB_PATH):
+        self.db_path = db_path
+        self.init_db()
+
+    def get_conn(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self) -> None:
+        with self.get_conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    summary TEXT,
+                    total_tokens INTEGER,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.get_conn() as conn:
+            row = conn.execute(
+                "SELECT output, summary, total_tokens FROM llm_response_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        ret = dict(row)
+        ret["summary"] = json.loads(ret["summary"]) if ret["summary"] else ""
+        return ret
+
+    def set(self, key: str, model: str, output: str, summary, total_tokens: int) -> None:
+        with self.get_conn() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_response_cache (key, model, output, summary, total_tokens)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, model, output, json.dumps(summary, ensure_ascii=False), total_tokens),
+            )
+
+    def extract_db(self, qry="SELECT key, model, total_tokens, created_at FROM llm_response_cache"):
+        with self.get_conn() as conn:
+            rows = conn.execute(qry).fetchall()
+        return [dict(r) for r in rows]
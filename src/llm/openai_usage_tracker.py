@@ -7,6 +7,48 @@ import sqlite3
 TOKEN_CAP = 2_000_000
 SPENT_PATH = "spent.json"
 DB_PATH = "usage.db"
+# output-token guess for a folder with no usage history yet (reasoning models run long)
+DEFAULT_OUTPUT_TOKENS = 8000
+# headroom on the observed average completion when reserving
+OUTPUT_ESTIMATE_MARGIN = 1.25
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """tiktoken count if installed, else one token per char (safe upper bound for Chinese)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding is False:
+        return len(text)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+class TokenBudget:
+    """Reserve estimated tokens before a call, reconcile with actual spend after."""
+
+    def __init__(self, cap: int, spent: int):
+        self.cap = cap
+        self.spent = spent
+        self.reserved = 0
+
+    def reserve(self, estimate: int) -> bool:
+        if self.spent + self.reserved + estimate > self.cap:
+            return False
+        self.reserved += estimate
+        return True
+
+    def release(self, estimate: int, spent=None) -> None:
+        # spent is the day's running total from UsageTracker.set, which also
+        # picks up other processes sharing spent.json
+        self.reserved -= estimate
+        if spent is not None:
+            self.spent = max(self.spent, spent)
 
 class UsageTracker:
     def __init__(self, path: str = SPENT_PATH, cap: int = TOKEN_CAP, model: str = "openai"):
@@ -37,6 +79,66 @@ class UsageTracker:
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
             """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache_stats (
+                day TEXT NOT NULL,
+                model TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, model, folder)
+            )
+            """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_rate_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                requests INTEGER,
+                retries INTEGER,
+                throttled INTEGER,
+                server_errors INTEGER,
+                timeouts INTEGER,
+                connection_errors INTEGER,
+                failures INTEGER,
+                final_concurrency INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+
+    def update_rate_stats(self, folder: str, s: dict):
+        with self.get_conn() as conn:
+            conn.execute("""
+            INSERT INTO llm_rate_stats (
+                provider, model, folder,
+                requests, retries, throttled, server_errors,
+                timeouts, connection_errors, failures, final_concurrency
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                s["provider"],
+                self.model,
+                folder,
+                s["requests"],
+                s["retries"],
+                s["throttled"],
+                s["server_errors"],
+                s["timeouts"],
+                s["connection_errors"],
+                s["failures"],
+                s["final_concurrency"],
+            ))
+
+    def update_cache_stats(self, folder: str, hit: bool):
+        day = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d")
+        with self.get_conn() as conn:
+            conn.execute("""
+            INSERT INTO llm_cache_stats (day, model, folder, hits, misses)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(day, model, folder) DO UPDATE SET
+                hits = hits + excluded.hits,
+                misses = misses + excluded.misses
+            """, (day, self.model, folder, int(hit), int(not hit)))
 
     def update_db(self, u):
         with self.get_conn() as conn:
@@ -59,6 +161,20 @@ class UsageTracker:
                 u["time_spent"],
             ))
 
+    def avg_completion_tokens(self, folder: str):
+        with self.get_conn() as conn:
+            row = conn.execute(
+                "SELECT AVG(completion_tokens) FROM llm_usage WHERE filename LIKE ?",
+                (folder + '/%',),
+            ).fetchone()
+        return row[0]
+
+    def estimate_output_tokens(self, folder: str) -> int:
+        avg = self.avg_completion_tokens(folder)
+        if avg is None:
+            return DEFAULT_OUTPUT_TOKENS
+        return int(avg * OUTPUT_ESTIMATE_MARGIN)
+
     def extract_db(self, qry="SELECT * FROM llm_usage"):
         with self.get_conn() as conn:
             rows = conn.execute(qry).fetchall()
@@ -0,0 +1,212 @@
+from collections import Counter
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import random
+import time
+
+import httpx
+from openai import APIConnectionError, APITimeoutError
+
+
+T = TypeVar("T")
+
+# Published per-account limits; None means the provider does not publish one
+# (DeepSeek throttles dynamically), leaving it to the AIMD concurrency control.
+PROVIDER_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 2_000_000, "max_concurrency": 64},
+    "deepseek": {"rpm": None, "tpm": None, "max_concurrency": 64},
+}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """Retryable error kind, or None for errors a retry will not fix."""
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        return "throttled"
+    if status is not None and status >= 500:
+        return "server_error"
+    if isinstance(exc, (APITimeoutError, asyncio.TimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(exc, (APIConnectionError, httpx.TransportError)):
+        return "connection"
+    return None
+
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    # full jitter, but never sooner than the server asked for
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def call_with_retry(fn: Callable[[], T], max_retries: int = MAX_RETRIES) -> T:
+    """Blocking retry with jittered exponential backoff, for calls on the sync client."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as exc:
+            if classify_error(exc) is None or attempt == max_retries:
+                raise
+            time.sleep(backoff_delay(attempt, get_retry_after(exc)))
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def take(self, n: float = 1) -> None:
+        n = min(n, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """Per-provider request gate: RPM/TPM token buckets plus an AIMD concurrency limit.
+
+    The limit grows by one after a full window of successes and halves on a
+    429/5xx/timeout, at most once per window: the errors from requests that
+    were already in flight when the limit was cut do not cut it again. A 429
+    also pauses every caller for its Retry-After.
+    Create it inside the event loop that uses it.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_concurrency: int = 64,
+        min_concurrency: int = 1,
+        start_concurrency: Optional[int] = None,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(start_concurrency or max_concurrency)
+        self.max_retries = max_retries
+        self.active = 0
+        self.successes = 0
+        # completions left before another error may halve the limit again
+        self.decrease_hold = 0
+        self.cooldown_until = 0.0
+        self.cond = asyncio.Condition()
+        self.rpm_bucket = TokenBucket(rpm) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm else None
+        self.stats = Counter()
+
+    @classmethod
+    def for_provider(cls, provider: str, max_concurrency: Optional[int] = None, **kwargs):
+        limits = dict(PROVIDER_LIMITS.get(provider, {}))
+        if max_concurrency is not None:
+            limits["max_concurrency"] = min(max_concurrency, limits.get("max_concurrency", max_concurrency))
+        limits.update(kwargs)
+        return cls(provider, **limits)
+
+    async def acquire(self, tokens: int = 0) -> None:
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+        try:
+            delay = self.cooldown_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.rpm_bucket is not None:
+                await self.rpm_bucket.take(1)
+            if self.tpm_bucket is not None and tokens:
+                await self.tpm_bucket.take(tokens)
+        except BaseException:
+            # cancelled while waiting: give the slot back
+            await self.release()
+            raise
+
+    async def release(self) -> None:
+        async with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def on_success(self) -> None:
+        self.stats["requests"] += 1
+        self.decrease_hold = max(0, self.decrease_hold - 1)
+        self.successes += 1
+        if self.successes >= int(self.limit) and self.limit < self.max_concurrency:
+            self.limit += 1
+            self.successes = 0
+
+    def on_retryable(self, kind: str, retry_after: Optional[float]) -> None:
+        self.stats["requests"] += 1
+        self.stats[kind] += 1
+        self.successes = 0
+        if kind != "connection":
+            if self.decrease_hold > 0:
+                self.decrease_hold -= 1
+            else:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                # everything else in flight was sent under the old limit
+                self.decrease_hold = self.active - 1
+        if kind == "throttled" and retry_after:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + retry_after)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """await fn() through the gate, retrying retryable errors up to max_retries times."""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(tokens)
+            try:
+                ret = await fn()
+            except Exception as exc:
+                kind = classify_error(exc)
+                if kind is None:
+                    self.stats["requests"] += 1
+                    self.stats["failures"] += 1
+                    raise
+                retry_after = get_retry_after(exc)
+                self.on_retryable(kind, retry_after)
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+            else:
+                self.on_success()
+                return ret
+            finally:
+                # also on CancelledError, which is not an Exception
+                await self.release()
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+    def snapshot(self) -> dict:
+        return {
+            "provider": self.provider,
+            "requests": self.stats["requests"],
+            "retries": self.stats["retries"],
+            "throttled": self.stats["throttled"],
+            "server_errors": self.stats["server_error"],
+            "timeouts": self.stats["timeout"],
+            "connection_errors": self.stats["connection"],
+            "failures": self.stats["failures"],
+            "final_concurrency": int(self.limit),
+        }
@@ -0,0 +1,126 @@
+from collections import defaultdict
+import glob
+import json
+import multiprocessing as mp
+import os
+
+import pandas as pd
+from tqdm import tqdm
+
+from src.transcript.normalize_transcript import NormFinder
+
+MODEL_OUTPUT_GLOB = 'outputs/model_output/*/*.json'
+TRANSCRIPT_DIR = 'transcripts/clean'
+REPORT_PATH = 'outputs/evidence_report.csv'
+N_WORKERS = os.cpu_count() or 1
+# files whose verbatim (hit) share of evidence falls below this are flagged
+MIN_HIT_RATIO = 0.8
+
+
+def iter_evidence(node, path=''):
+    """Yield (json path, text) of every evidence string in a model output.
+
+    Covers signals[*].evidence as a list of strings and the older
+    evidence[*].sentence spans; synthesis spans are model-written and skipped.
+    """
+    if isinstance(node, dict):
+        prefix = f'{path}.' if path else ''
+        if isinstance(node.get('sentence'), str) and node.get('evidence_type') != 'synthesis':
+            yield f'{prefix}sentence', node['sentence']
+        for k, v in node.items():
+            if k == 'evidence' and isinstance(v, str):
+                yield f'{prefix}{k}', v
+            elif k == 'evidence' and isinstance(v, list) and all(isinstance(x, str) for x in v):
+                for i, x in enumerate(v):
+                    yield f'{prefix}{k}[{i}]', x
+            elif isinstance(v, (dict, list)):
+                yield from iter_evidence(v, f'{prefix}{k}')
+    elif isinstance(node, list):
+        for i, x in enumerate(node):
+            yield from iter_evidence(x, f'{path}[{i}]')
+
+
+def validate_day(args):
+    """Check every evidence string of one day's outputs against its transcript."""
+    dt, output_files = args
+    transcript_path = os.path.join(TRANSCRIPT_DIR, f'{dt}.txt')
+    nf = None
+    if os.path.exists(transcript_path):
+        with open(transcript_path, 'r', encoding='utf-8') as ifile:
+            transcript = ifile.read()
+        if transcript.strip():
+            nf = NormFinder(transcript)
+
+    rows = []
+    for output_file in output_files:
+        base = {'folder': os.path.basename(os.path.dirname(output_file)), 'dt': dt}
+        try:
+            with open(output_file, 'r', encoding='utf-8') as ifile:
+                payload = json.load(ifile)
+        except Exception as e:
+            rows.append({**base, 'path': '', 'evidence': '', 'match': 'bad_json', 'error': str(e)})
+            continue
+
+        spans = [x for x in iter_evidence(payload) if x[1].strip()]
+        if nf is None:
+            for path, text in spans:
+                rows.append({**base, 'path': path, 'evidence': text, 'match': 'no_transcript'})
+            continue
+
+        for (path, text), res in zip(spans, nf.locate_many([x[1] for x in spans])):
+            rows.append({
+                **base,
+                'path': path,
+                'evidence': text,
+                'match': res['match'],
+                'normalized_idx': res['normalized_idx'],
+                'raw_idx': res['raw_idx'],
+                'win_vote': res.get('win_vote'),
+                'total_vote': res.get('total_vote'),
+            })
+    return rows
+
+
+def validate_outputs(glob_pattern=MODEL_OUTPUT_GLOB, n_workers=N_WORKERS):
+    """One row per evidence string across every model folder and day."""
+    by_day = defaultdict(list)
+    for f in sorted(glob.glob(glob_pattern)):
+        dt = os.path.basename(f).split('.')[0]
+        by_day[dt].append(f)
+    tasks = sorted(by_day.items())
+
+    rows = []
+    if n_workers <= 1:
+        for task in tqdm(tasks, desc='validate', unit='day'):
+            rows.extend(validate_day(task))
+    else:
+        ctx = mp.get_context('spawn')
+        with ctx.Pool(n_workers) as pool:
+            for ret in tqdm(pool.imap_unordered(validate_day, tasks, chunksize=4), total=len(tasks), desc='validate', unit='day'):
+                rows.extend(ret)
+    return pd.DataFrame(rows, columns=[
+        'folder', 'dt', 'path', 'evidence', 'match',
+        'normalized_idx', 'raw_idx', 'win_vote', 'total_vote', 'error',
+    ])
+
+
+def summarize(df, min_hit_ratio=MIN_HIT_RATIO):
+    """Per-folder match counts, and the (folder, dt) outputs below min_hit_ratio."""
+    counts = df.pivot_table(index='folder', columns='match', values='evidence', aggfunc='count', fill_value=0)
+    per_file = df.groupby(['folder', 'dt'])['match'].agg(
+        n='count',
+        hit_ratio=lambda x: (x == 'hit').mean(),
+    ).reset_index()
+    flagged = per_file[per_file['hit_ratio'] < min_hit_ratio]
+    return counts, flagged
+
+
+if __name__ == '__main__':
+    df = validate_outputs()
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    df.to_csv(REPORT_PATH, index=False)
+
+    counts, flagged = summarize(df)
+    print(counts)
+    print(f'{len(flagged)} outputs below {MIN_HIT_RATIO:.0%} verbatim evidence')
+    print(flagged.sort_values('hit_ratio').head(50).to_string(index=False))
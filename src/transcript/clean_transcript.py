@@ -0,0 +1,135 @@
+from functools import partial
+import hashlib
+import inspect
+import json
+import multiprocessing as mp
+import os
+import re
+
+from tqdm import tqdm
+
+from src.transcript.normalize_transcript import get_normalizer_version, normalize_zh_transcript
+
+# Kept apart from pipelines/transcript/generate_transcript.py so that spawned
+# clean workers import numpy + opencc only, not faster_whisper / torch.
+
+CLEAN_WRAP_WIDTH = 60
+
+
+def wrap_by_whitespace(text: str, max_len: int = 30) -> str:
+    tokens = re.findall(r"\S+", text)
+
+    lines = []
+    current = ""
+
+    for tok in tokens:
+        if not current:
+            current = tok
+        else:
+            candidate = current + " " + tok
+            if len(candidate) <= max_len:
+                current = candidate
+            else:
+                lines.append(current)
+                current = tok
+
+    if current:
+        lines.append(current)
+
+    return "\n".join(lines)
+
+
+def get_cleaner_version(wrap_width=CLEAN_WRAP_WIDTH):
+    """Hash of the cleaning code, so editing the normalizer rebuilds every clean file."""
+    src = inspect.getsource(wrap_by_whitespace) + inspect.getsource(clean_transcript_file)
+    return hashlib.sha1(f"{src}|{get_normalizer_version()}|{wrap_width}".encode("utf-8")).hexdigest()[:12]
+
+
+def get_clean_key(transcript_path, cleaner_version):
+    with open(transcript_path, "rb") as ifile:
+        raw_hash = hashlib.sha1(ifile.read()).hexdigest()
+    return f"{raw_hash}_{cleaner_version}"
+
+
+def get_clean_out(transcript_path, clean_dir):
+    transcript_path2 = re.findall(r"\d+", os.path.basename(transcript_path))[0]
+    return os.path.join(clean_dir, f"{transcript_path2}.txt")
+
+
+def load_clean_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as ifile:
+            return json.load(ifile)
+    except Exception:
+        return {}
+
+
+def save_clean_manifest(manifest, manifest_path):
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as ofile:
+        json.dump(manifest, ofile, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def clean_transcript_file(transcript_path, clean_dir, wrap_width=CLEAN_WRAP_WIDTH):
+    with open(transcript_path, "r", encoding="utf-8") as ifile:
+        transcript_raw = ifile.read()
+
+    if not transcript_raw.strip():
+        return
+
+    out_file = get_clean_out(transcript_path, clean_dir)
+
+    transcript_clean = normalize_zh_transcript(transcript_raw)
+    transcript_clean2 = wrap_by_whitespace(transcript_clean, wrap_width)
+
+    with open(out_file + ".tmp", "w", encoding="utf-8") as ofile:
+        ofile.write(transcript_clean2)
+    os.replace(out_file + ".tmp", out_file)
+    return out_file
+
+
+def clean_transcripts(
+    transcript_paths,
+    clean_dir,
+    manifest_path,
+    n_workers=1,
+    wrap_width=CLEAN_WRAP_WIDTH,
+    verbose=False,
+):
+    """Rebuild clean transcripts whose raw text or cleaning code changed."""
+    manifest = load_clean_manifest(manifest_path)
+    cleaner_version = get_cleaner_version(wrap_width)
+
+    todo = {}
+    for transcript_path in transcript_paths:
+        key = get_clean_key(transcript_path, cleaner_version)
+        name = os.path.basename(transcript_path)
+        out_file = get_clean_out(transcript_path, clean_dir)
+        if manifest.get(name) == key and os.path.exists(out_file) and os.path.getsize(out_file) > 0:
+            continue
+        todo[transcript_path] = key
+
+    if verbose:
+        print(f"clean: {len(todo)} to rebuild, {len(transcript_paths) - len(todo)} up to date")
+
+    paths = list(todo)
+    func = partial(clean_transcript_file, clean_dir=clean_dir, wrap_width=wrap_width)
+    pool = None
+    if n_workers <= 1 or len(paths) <= 1:
+        results = map(func, paths)
+    else:
+        ctx = mp.get_context("spawn")
+        pool = ctx.Pool(min(n_workers, len(paths)))
+        results = pool.imap(func, paths, chunksize=8)
+
+    try:
+        for transcript_path, out_file in tqdm(zip(paths, results), total=len(paths), desc="clean", unit="file"):
+            if out_file is not None:
+                manifest[os.path.basename(transcript_path)] = todo[transcript_path]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        save_clean_manifest(manifest, manifest_path)
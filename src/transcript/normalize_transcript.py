@@ -1,50 +1,76 @@
-from typing import List, Tuple
+from typing import Tuple
 import textwrap
-from collections import Counter
-import re
+from collections import Counter, OrderedDict
+from functools import lru_cache
+import glob
+import hashlib
+import inspect
+import os
+import time
+import numpy as np
 from opencc import OpenCC
 
 to_simplified = OpenCC("t2s") 
 
+# the memo caches are keyed by the source of _normalize_zh_transcript; bump this
+# for output changes that source does not show (e.g. an OpenCC upgrade)
+NORMALIZE_VERSION = 1
+# the same transcript is normalised once per extraction batch; keep the last few
+NORMALIZE_CACHE_SIZE = 64
+NORMALIZE_CACHE_DIR = os.getenv("NORMALIZE_CACHE_DIR")
+_normalize_cache = OrderedDict()
+
+# every code point str.isspace() accepts (all <= U+3000), for a vectorized whitespace mask
+WHITESPACE_CODES = np.array([i for i in range(0x3001) if chr(i).isspace()], dtype=np.uint32)
+
+# n-gram index used by locate / locate_fuzzy
+NGRAM = 4
+NGRAM_BASE = np.uint64(1000003)
+# grams seen more often than this carry no position information; fuzzy votes skip them
+MAX_GRAM_HITS = 256
+# implied starts this close together vote for the same match (ASR insertions/deletions)
+FUZZY_SLACK = 2
+FUZZY_MIN_VOTE = 0.3
+
+
+def ngram_keys(s: str, n: int = NGRAM) -> np.ndarray:
+    """Rolling uint64 hash of every n-char window of s (wraps mod 2**64)."""
+    codes = np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    m = len(codes) - n + 1
+    if m <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    keys = np.zeros(m, dtype=np.uint64)
+    for k in range(n):
+        keys = keys * NGRAM_BASE + codes[k:k + m]
+    return keys
+
+
 class NormFinder:
     def __init__(self, raw: str):
         if not raw:
             return
         self.raw = raw
-        self.norm, self.norm2raw_list = self._normalize_with_map(raw)
-        self.norm2raw = {idx: v for idx, v in enumerate(self.norm2raw_list)}
-
-        raw2norm = {v:k for k,v in self.norm2raw.items()} # this has gap
-        self.raw2norm = {}
-        prev = raw2norm[min(raw2norm)]   # fill missing gap with previous value
-        for i in range(min(raw2norm), max(raw2norm) + 1):
-            prev = raw2norm.get(i, prev)
-            self.raw2norm[i] = prev
-
-    def _normalize_with_map(self, s: str) -> Tuple[str, List[int]]:
-        norm_chars: List[str] = []
-        norm2raw: List[int] = []
-
-        i, n = 0, len(s)
-        while i < n:
-            ch = s[i]
-            if ch.isspace():
-                # consume whitespace run
-                j = i
-                while j < n and s[j].isspace():
-                    j += 1
-
-                i = j
-            else:
-                norm_chars.append(ch)
-                norm2raw.append(i)
-                i += 1
-
-        return "".join(norm_chars), norm2raw
+        self.norm, self.norm2raw, self.raw2norm = self._normalize_with_map(raw)
+        self.norm2raw_list = self.norm2raw
+        self.gram_keys = None
+        self.gram_pos = None
+
+    def _normalize_with_map(self, s: str) -> Tuple[str, np.ndarray, np.ndarray]:
+        """Drop whitespace; return (norm, norm2raw, raw2norm) as int32 offset vectors.
+
+        raw2norm of a whitespace char is the norm index of the char before it
+        (0 for leading whitespace).
+        """
+        codes = np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32)
+        keep = ~np.isin(codes, WHITESPACE_CODES)
+        norm = codes[keep].tobytes().decode("utf-32-le")
+        norm2raw = np.flatnonzero(keep).astype(np.int32)
+        raw2norm = np.maximum(np.cumsum(keep, dtype=np.int32) - 1, 0).astype(np.int32)
+        return norm, norm2raw, raw2norm
 
     def normalize(self, s: str) -> str:
-        # we only need normalized string; ignore map
-        return self._normalize_with_map(s)[0]
+        # needles are short; no need for the maps
+        return "".join(s.split())
 
     def find(self, needle: str, start_norm: int = 0) -> int:
         needle_n = self.normalize(needle)
@@ -55,7 +81,96 @@ class NormFinder:
         if j == -1:
             return -1, -1
 
-        return j, self.norm2raw[j]
+        return j, int(self.norm2raw[j])
+
+    def build_index(self):
+        """Sorted NGRAM-gram index over norm; built on first locate call."""
+        keys = ngram_keys(self.norm)
+        order = np.argsort(keys, kind="stable")
+        self.gram_keys = keys[order]
+        self.gram_pos = order.astype(np.int32)
+
+    def _gram_ranges(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # gram_pos[lo[k]:hi[k]] are the norm positions of keys[k]
+        lo = np.searchsorted(self.gram_keys, keys, side="left")
+        hi = np.searchsorted(self.gram_keys, keys, side="right")
+        return lo, hi
+
+    def locate(self, needle: str, start_norm: int = 0) -> Tuple[int, int]:
+        """Same result as find(), answered from the n-gram index."""
+        needle_n = self.normalize(needle)
+        if len(needle_n) < NGRAM:
+            return self.find(needle_n, start_norm)
+        if self.gram_keys is None:
+            self.build_index()
+
+        # the rarest gram of the needle gives the fewest candidates to verify
+        lo, hi = self._gram_ranges(ngram_keys(needle_n))
+        k = int(np.argmin(hi - lo))
+        for j in self.gram_pos[lo[k]:hi[k]] - k:
+            if j >= start_norm and self.norm.startswith(needle_n, j):
+                return int(j), int(self.norm2raw[j])
+        return -1, -1
+
+    def locate_fuzzy(self, needle: str, start_norm: int = 0, min_vote: float = FUZZY_MIN_VOTE) -> dict:
+        """ASR-noise tolerant locate: every needle gram votes for the start it implies.
+
+        Returns the same keys as find_by_chunk; normalized_idx is -1 when fewer
+        than min_vote of the grams agree.
+        """
+        needle_n = self.normalize(needle)
+        keys = ngram_keys(needle_n)
+        ret = {'normalized_idx': -1, 'raw_idx': -1, 'win_vote': 0, 'total_vote': len(keys)}
+        if not len(keys):
+            j, raw_idx = self.find(needle_n, start_norm)
+            if j != -1:
+                ret.update(normalized_idx=j, raw_idx=raw_idx, win_vote=1, total_vote=1)
+            return ret
+        if self.gram_keys is None:
+            self.build_index()
+
+        lo, hi = self._gram_ranges(keys)
+        implied = [
+            self.gram_pos[lo[k]:hi[k]] - k
+            for k in range(len(keys))
+            if 0 < hi[k] - lo[k] <= MAX_GRAM_HITS
+        ]
+        if not implied:
+            return ret
+
+        starts, counts = np.unique(np.concatenate(implied), return_counts=True)
+        keep = starts >= start_norm
+        starts, counts = starts[keep], counts[keep]
+        if not len(starts):
+            return ret
+        # votes within +-FUZZY_SLACK of each start
+        csum = np.concatenate([[0], np.cumsum(counts)])
+        lo = np.searchsorted(starts, starts - FUZZY_SLACK, side="left")
+        hi = np.searchsorted(starts, starts + FUZZY_SLACK, side="right")
+        votes = csum[hi] - csum[lo]
+        best = int(np.argmax(votes))
+        if votes[best] < min_vote * len(keys):
+            return ret
+
+        j = int(min(max(starts[best], 0), len(self.norm2raw) - 1))
+        ret.update(normalized_idx=j, raw_idx=int(self.norm2raw[j]), win_vote=int(votes[best]))
+        return ret
+
+    def locate_many(self, needles, fuzzy: bool = True) -> list:
+        """Locate every needle against the one index; exact first, then fuzzy."""
+        ret = []
+        for needle in needles:
+            j, raw_idx = self.locate(needle)
+            if j != -1:
+                ret.append({'match': 'hit', 'normalized_idx': j, 'raw_idx': raw_idx})
+                continue
+            if fuzzy:
+                res = self.locate_fuzzy(needle)
+                if res['normalized_idx'] != -1:
+                    ret.append({'match': 'fuzzy', **res})
+                    continue
+            ret.append({'match': 'miss', 'normalized_idx': -1, 'raw_idx': -1})
+        return ret
 
     def find_by_chunk(self, needle: str, start_norm: int = 0, chunksize: int=10) -> int:
         needle_n = self.normalize(needle)
@@ -70,34 +185,91 @@ class NormFinder:
         c = Counter(implied_starts)
         # print(len(needle_n), implied_starts)
         s_hat, votes = c.most_common(1)[0]
+        raw_idx = int(self.norm2raw[s_hat]) if 0 <= s_hat < len(self.norm2raw) else -1
         return { 'normalized_idx': s_hat,
-                'raw_idx': self.norm2raw[s_hat], 
+                'raw_idx': raw_idx, 
                 'win_vote' : votes ,
                  'total_vote' : len(implied_starts), 
                  'extra_debug': c}
 
 
     def normalize_zh_transcript(self, text: str) -> str:
-        text = text.replace("\r\n", "\n").replace("\r", "\n")
-        text = re.sub(r"\n\s*\n+", "\n\n", text.strip())
-
-        lines = [ln.strip() for ln in text.split("\n")]
-        out = []
-        for ln in lines:
-            if not ln:
-                out.append("")  
-                continue
-            if not out or out[-1] == "":
-                out.append(ln)
-                continue
+        return normalize_zh_transcript(text)
+
+
+def _normalize_zh_transcript(text: str) -> str:
+    # The old line-merge pass only chose between " " and "\n" when joining
+    # lines, and its final \s+ -> " " collapse erased that choice, so the
+    # result is every whitespace run collapsed, then t2s.
+    return to_simplified.convert(" ".join(text.split()))
+
+
+@lru_cache(maxsize=1)
+def get_normalizer_version() -> str:
+    src = inspect.getsource(_normalize_zh_transcript)
+    return hashlib.sha1(f"{src}|{NORMALIZE_VERSION}".encode("utf-8")).hexdigest()[:12]
+
+
+def get_normalize_cache_key(text: str) -> str:
+    return hashlib.sha1(f"{get_normalizer_version()}|{text}".encode("utf-8")).hexdigest()
+
+
+def normalize_zh_transcript(text: str) -> str:
+    """Memoized _normalize_zh_transcript: in-memory LRU, plus NORMALIZE_CACHE_DIR if set."""
+    key = get_normalize_cache_key(text)
+    if key in _normalize_cache:
+        _normalize_cache.move_to_end(key)
+        return _normalize_cache[key]
+
+    path = os.path.join(NORMALIZE_CACHE_DIR, f"{key}.txt") if NORMALIZE_CACHE_DIR else None
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as ifile:
+            ret = ifile.read()
+    else:
+        ret = _normalize_zh_transcript(text)
+        if path:
+            os.makedirs(NORMALIZE_CACHE_DIR, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as ofile:
+                ofile.write(ret)
+            os.replace(path + ".tmp", path)
+
+    _normalize_cache[key] = ret
+    if len(_normalize_cache) > NORMALIZE_CACHE_SIZE:
+        _normalize_cache.popitem(last=False)
+    return ret
+
+
+def benchmark_normalize(paths, repeats: int = 3) -> dict:
+    """Seconds to normalise every file in paths: cold, then repeats-1 memoized passes."""
+    global NORMALIZE_CACHE_DIR
+    texts = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as ifile:
+            texts.append(ifile.read())
+
+    cache_dir, NORMALIZE_CACHE_DIR = NORMALIZE_CACHE_DIR, None
+    _normalize_cache.clear()
+    ret = {"files": len(texts), "chars": sum(len(x) for x in texts)}
+    try:
+        start = time.perf_counter()
+        for text in texts:
+            " ".join(text.split())
+        ret["whitespace"] = time.perf_counter() - start
+        for i in range(repeats):
+            start = time.perf_counter()
+            for text in texts:
+                normalize_zh_transcript(text)
+            ret["cold" if i == 0 else f"warm{i}"] = time.perf_counter() - start
+    finally:
+        NORMALIZE_CACHE_DIR = cache_dir
+        _normalize_cache.clear()
+    return ret
 
-            
-            if not re.search(r"[。！？!?：:）\)]$", out[-1]) and len(out[-1]) < 60:
-                out[-1] = out[-1] + " " + ln
-            else:
-                out.append(ln)
 
-        text2 = "\n".join(out)
-        # text2 = re.sub(r"\n{3,}", "\n\n", text2).strip()
-        text2 = re.sub(r'\s+', ' ', text2).strip()
-        return to_simplified.convert(text2)
\ No newline at end of file
+if __name__ == "__main__":
+    # a year of clean transcripts, e.g. YEAR=2025
+    year = os.getenv("YEAR", "2025")
+    paths = sorted(glob.glob(f"transcripts/clean/{year}*.txt"))
+    # a larger LRU so the warm passes hit for every file
+    NORMALIZE_CACHE_SIZE = max(NORMALIZE_CACHE_SIZE, len(paths))
+    print(benchmark_normalize(paths))
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+
+from src.transcript.normalize_transcript import NormFinder
+
+
+class SegmentTable:
+    """Columnar Whisper segments of one episode.
+
+    text_start/text_end are offsets into the raw transcript (the newline-joined
+    segment texts), so a character in the raw transcript maps to its segment by
+    binary search over text_start.
+    """
+
+    COLUMNS = ('start', 'end', 'text_start', 'text_end', 'avg_logprob')
+
+    def __init__(self, start, end, text_start, text_end, avg_logprob):
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+        self.text_start = np.asarray(text_start, dtype=np.int64)
+        self.text_end = np.asarray(text_end, dtype=np.int64)
+        self.avg_logprob = np.asarray(avg_logprob, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.start)
+
+    @classmethod
+    def from_rows(cls, rows, spans):
+        """rows are checkpoint dicts; spans are (row index, text_start, text_end)
+        of the rows that made it into the joined text."""
+        idx = [x[0] for x in spans]
+        return cls(
+            start=[rows[i]['start'] for i in idx],
+            end=[rows[i]['end'] for i in idx],
+            text_start=[x[1] for x in spans],
+            text_end=[x[2] for x in spans],
+            avg_logprob=[rows[i].get('avg_logprob', np.nan) for i in idx],
+        )
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # np.savez appends .npz to names that lack it
+        tmp = path[:-4] + '.tmp.npz'
+        np.savez(tmp, **{k: getattr(self, k) for k in self.COLUMNS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{k: data[k] for k in cls.COLUMNS})
+
+    def segment_at_raw(self, raw_offset):
+        # a newline between segments belongs to the segment before it
+        i = int(np.searchsorted(self.text_start, raw_offset, side='right')) - 1
+        return min(max(i, 0), len(self) - 1)
+
+    def time_at_raw(self, raw_offset):
+        """Video time in seconds of the raw transcript character at raw_offset."""
+        if not len(self):
+            return None
+        return float(self.start[self.segment_at_raw(raw_offset)])
+
+    def raw_span(self, start_sec, end_sec):
+        """(text_start, text_end) of the raw text spoken between two video times."""
+        i = int(np.searchsorted(self.end, start_sec, side='right'))
+        j = int(np.searchsorted(self.start, end_sec, side='left'))
+        if i >= j:
+            return None
+        return int(self.text_start[i]), int(self.text_end[j - 1])
+
+
+class TranscriptTimeline:
+    """Map offsets / evidence in the clean transcript back to video time.
+
+    The clean transcript is the raw one with whitespace rewritten and t2s
+    applied, so both share the whitespace-free NormFinder index: clean offset
+    -> norm index -> raw offset (norm2raw) -> segment (binary search).
+    """
+
+    def __init__(self, raw, clean, table):
+        self.raw_finder = NormFinder(raw)
+        self.clean_finder = NormFinder(clean)
+        self.table = table
+        self.n_norm = min(len(self.raw_finder.norm), len(self.clean_finder.norm))
+
+    def raw_offset(self, clean_offset):
+        if not 0 <= clean_offset < len(self.clean_finder.raw2norm) or not self.n_norm:
+            return None
+        norm_idx = min(self.clean_finder.raw2norm[clean_offset], self.n_norm - 1)
+        return self.raw_finder.norm2raw[norm_idx]
+
+    def time_at(self, clean_offset):
+        raw_offset = self.raw_offset(clean_offset)
+        if raw_offset is None:
+            return None
+        return self.table.time_at_raw(raw_offset)
+
+    def find_time(self, needle, start_norm=0):
+        """Video time where needle (e.g. a Step 3 evidence string) is spoken."""
+        norm_idx, _ = self.clean_finder.find(needle, start_norm)
+        if norm_idx == -1 or norm_idx >= self.n_norm:
+            return None
+        return self.table.time_at_raw(self.raw_finder.norm2raw[norm_idx])
+
+
+def load_timeline(dt, raw_dir, clean_dir, segment_dir):
+    dt = dt.strip('【】')
+    with open(os.path.join(raw_dir, f'【{dt}】.txt'), 'r', encoding='utf-8') as ifile:
+        raw = ifile.read()
+    with open(os.path.join(clean_dir, f'{dt}.txt'), 'r', encoding='utf-8') as ifile:
+        clean = ifile.read()
+    table = SegmentTable.load(os.path.join(segment_dir, f'{dt}.npz'))
+    return TranscriptTimeline(raw, clean, table)
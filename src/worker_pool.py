@@ -0,0 +1,183 @@
+import multiprocessing as mp
+import os
+import queue
+import resource
+import time
+import traceback
+
+# workers that die before finishing warmup are respawned at most this many
+# times per pool; past that the warmup itself is assumed broken
+MAX_WARMUP_RESPAWNS = 3
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as ifile:
+            pages = int(ifile.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
+    except Exception:
+        # peak, not current, but the best we have off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker_main(func, warmup, task_q, result_q, current, max_rss_mb):
+    pid = os.getpid()
+    start = time.perf_counter()
+    if warmup is not None:
+        try:
+            warmup()
+        except Exception:
+            result_q.put(('error', pid, traceback.format_exc()))
+            return
+    result_q.put(('ready', pid, time.perf_counter() - start))
+
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        idx, arg = task
+        # shared memory, so the parent still sees it if this process is killed
+        current.value = idx
+
+        start = time.perf_counter()
+        ret, err = None, None
+        try:
+            ret = func(arg)
+        except Exception:
+            err = traceback.format_exc()
+        rss = current_rss_mb()
+        retire = bool(max_rss_mb) and rss > max_rss_mb
+        result_q.put(('done', pid, idx, ret, err, time.perf_counter() - start, rss, retire))
+        current.value = -1
+        if retire:
+            break
+
+
+class WarmPool:
+    """Long-lived worker processes that load their models once and keep them.
+
+    Unlike Pool(maxtasksperchild=1), a worker is recycled only when its RSS
+    after a task exceeds max_rss_mb. warmup runs once per worker before it takes
+    work, so model load time and per-task time are reported separately in
+    stats / format_stats().
+    """
+
+    def __init__(self, n_workers, func, warmup=None, max_rss_mb=None, context='spawn'):
+        self.n_workers = n_workers
+        self.func = func
+        self.warmup = warmup
+        self.max_rss_mb = max_rss_mb
+        self.ctx = mp.get_context(context)
+        self.task_q = self.ctx.Queue()
+        self.result_q = self.ctx.Queue()
+        self.workers = {}
+        self.current = {}
+        self.stats = {}
+        self.recycled = 0
+        self.warmup_respawns = 0
+
+    def __enter__(self):
+        for _ in range(self.n_workers):
+            self._spawn()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _spawn(self):
+        current = self.ctx.Value('i', -1, lock=False)
+        proc = self.ctx.Process(
+            target=_worker_main,
+            args=(self.func, self.warmup, self.task_q, self.result_q, current, self.max_rss_mb),
+            daemon=True,
+        )
+        proc.start()
+        self.workers[proc.pid] = proc
+        self.current[proc.pid] = current
+        self.stats[proc.pid] = {'load_time': None, 'tasks': 0, 'work_time': 0.0, 'max_rss_mb': 0.0}
+
+    def _reap_crashed(self):
+        # a clean exit (code 0) is a retiring worker whose 'done' is still in flight
+        lost = []
+        for pid, proc in list(self.workers.items()):
+            if proc.is_alive() or proc.exitcode == 0:
+                continue
+            self.workers.pop(pid)
+            idx = self.current.pop(pid).value
+            if idx >= 0:
+                lost.append((idx, f'worker {pid} died with exit code {proc.exitcode}'))
+            if self.stats[pid]['load_time'] is None:
+                # died during warmup (e.g. OOM loading the model)
+                self.warmup_respawns += 1
+                if self.warmup_respawns > MAX_WARMUP_RESPAWNS:
+                    raise RuntimeError(
+                        f'worker {pid} died during warmup with exit code {proc.exitcode}; '
+                        f'gave up after {MAX_WARMUP_RESPAWNS} respawns'
+                    )
+            self._spawn()
+        return lost
+
+    def imap_unordered(self, args):
+        """Yield func(arg) for every arg, in completion order."""
+        args = list(args)
+        for idx, arg in enumerate(args):
+            self.task_q.put((idx, arg))
+
+        remaining = len(args)
+        while remaining:
+            try:
+                msg = self.result_q.get(timeout=1.0)
+            except queue.Empty:
+                lost = self._reap_crashed()
+                if lost:
+                    idx, err = lost[0]
+                    raise RuntimeError(f'task {idx} ({args[idx]!r}) failed: {err}')
+                continue
+
+            kind, pid = msg[0], msg[1]
+            if kind == 'ready':
+                self.stats[pid]['load_time'] = msg[2]
+            elif kind == 'error':
+                raise RuntimeError(f'worker {pid} failed during warmup:\n{msg[2]}')
+            elif kind == 'done':
+                _, _, idx, ret, err, work_time, rss, retire = msg
+                stat = self.stats[pid]
+                stat['tasks'] += 1
+                stat['work_time'] += work_time
+                stat['max_rss_mb'] = max(stat['max_rss_mb'], rss)
+                remaining -= 1
+                if retire:
+                    self.workers.pop(pid).join()
+                    self.current.pop(pid)
+                    self.recycled += 1
+                    self._spawn()
+                if err is not None:
+                    raise RuntimeError(f'task {idx} ({args[idx]!r}) failed:\n{err}')
+                yield ret
+
+    def close(self):
+        # drop tasks nobody has picked up yet (e.g. after a failure)
+        while True:
+            try:
+                self.task_q.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self.workers:
+            self.task_q.put(None)
+        for proc in self.workers.values():
+            proc.join(timeout=30)
+            if proc.is_alive():
+                proc.terminate()
+        self.workers = {}
+
+    def format_stats(self):
+        loads = [x['load_time'] for x in self.stats.values() if x['load_time'] is not None]
+        tasks = sum(x['tasks'] for x in self.stats.values())
+        work = sum(x['work_time'] for x in self.stats.values())
+        peak = max([x['max_rss_mb'] for x in self.stats.values()] or [0.0])
+        return (
+            f'workers started: {len(self.stats)} (recycled {self.recycled}), '
+            f'model load: {sum(loads):.1f}s total / {sum(loads) / max(len(loads), 1):.1f}s avg, '
+            f'tasks: {tasks}, work: {work:.1f}s total / {work / max(tasks, 1):.1f}s avg, '
+            f'peak rss: {peak:.0f} MB'
+        )